@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test of the paginated readings API of the webapp: concurrent clients page
+through /readings, /meters/{name}/readings and /addresses/{text}/readings
+(following next_cursor) against databases of growing size. With keyset
+pagination the latency per page stays flat as Readings grows.
+
+The webapp runs under uvicorn in a separate process, the clients use urllib.
+
+usage: python benchmarks/bench_api.py [sizes...]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from core.migration_manager import MigrationManager
+from benchmarks.bench_ingest import INIT_DB
+
+SIZES = [100_000, 1_000_000, 3_000_000]
+METERS = 400
+CLIENTS = 8
+SECONDS = 10
+PAGES = 20 # pages per walk, then start over at a random place
+PORT = 8765
+
+SERVER = f"""
+import sys
+sys.path.insert(0, ".")
+import uvicorn
+from webapp.main import app
+uvicorn.run(app, host="127.0.0.1", port={PORT}, log_level="warning")
+"""
+
+
+def make_database(db_path, count):
+    """ [count] hourly readings spread over METERS meters, four meters per address. """
+    shutil.copy(INIT_DB, db_path)
+    MigrationManager(db_path).migrate()
+    start = datetime(2020, 1, 1)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("INSERT INTO Addresses (AddressText) VALUES (?)", [(f"A{a:03d}",) for a in range(METERS // 4)])
+        conn.executemany(
+            "INSERT INTO Meters (MeterName, AddressID) VALUES (?, ?)",
+            [(f"A{m // 4:03d}_E{m % 4:02d}@22", m // 4 + 1) for m in range(METERS)],
+        )
+        conn.executemany(
+            "INSERT INTO Readings (MeterID, ReadingValue, ReadingDate) VALUES (?, ?, ?)",
+            (
+                (m + 1, 100_000 + h, (start + timedelta(hours=h)).isoformat())
+                for m in range(METERS)
+                for h in range(count // METERS)
+            ),
+        )
+    conn.close()
+    return (start + timedelta(hours=count // METERS)).isoformat()
+
+
+def get(path):
+    start = time.perf_counter()
+    with urllib.request.urlopen(f"http://127.0.0.1:{PORT}{path}") as response:
+        page = json.load(response)
+    return time.perf_counter() - start, page
+
+
+def client(end, deadline):
+    """ Walk pages of random endpoints and date ranges until [deadline]. """
+    latencies = []
+    rng = random.Random()
+    hours = int((datetime.fromisoformat(end) - datetime(2020, 1, 1)).total_seconds() // 3600)
+    while time.monotonic() < deadline:
+        meter = rng.randrange(METERS)
+        since = (datetime(2020, 1, 1) + timedelta(hours=rng.randrange(hours))).isoformat()
+        path = rng.choice([
+            f"/readings?since={since}&limit=100",
+            f"/meters/A{meter // 4:03d}_E{meter % 4:02d}@22/readings?since={since}&limit=100",
+            f"/addresses/A{meter // 4:03d}/readings?limit=100",
+        ])
+        for _ in range(PAGES):
+            elapsed, page = get(path)
+            latencies.append(elapsed)
+            if not page["next_cursor"]:
+                break
+            path = path.split("&cursor=")[0] + f"&cursor={page['next_cursor']}"
+    return latencies
+
+
+def wait_for_server(process):
+    for _ in range(100):
+        try:
+            get("/")
+            return
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("webapp did not start")
+            time.sleep(0.1)
+    raise RuntimeError("webapp did not start")
+
+
+def main(sizes):
+    print(f"{'readings':>10} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            db_path = os.path.join(workdir, "bench.db")
+            end = make_database(db_path, size)
+
+            server = subprocess.Popen(
+                [sys.executable, "-c", SERVER],
+                env=dict(os.environ, DB_FILE=db_path),
+            )
+            try:
+                wait_for_server(server)
+                deadline = time.monotonic() + SECONDS
+                with ThreadPoolExecutor(CLIENTS) as executor:
+                    latencies = sorted(
+                        latency
+                        for result in executor.map(client, [end] * CLIENTS, [deadline] * CLIENTS)
+                        for latency in result
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"{size:>10} {len(latencies):>9} {len(latencies) / SECONDS:>8.0f} "
+            f"{statistics.median(latencies) * 1000:>8.1f} {p99 * 1000:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark DataManager.archive_files for every archive codec on a backlog of
+synthetic meter files.
+
+usage: python benchmarks/bench_archive.py [file_count] [codecs...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from scraper.data_manager import DataManager
+from scraper.archive_backend import EXTENSIONS, iter_members
+from benchmarks.bench_ingest import BenchConfig
+from benchmarks.bench_csv import make_meter_files
+
+FILE_COUNT = 5_000
+
+
+def main(count, codecs):
+    print(f"{'files':>6} {'codec':>8} {'total s':>9} {'ms/file':>8} {'kB':>8} {'ok':>5}")
+    for codec in codecs:
+        with tempfile.TemporaryDirectory() as workdir:
+            datadir = os.path.join(workdir, "data")
+            backupdir = os.path.join(workdir, "backup")
+            os.makedirs(datadir)
+            make_meter_files(datadir, count)
+
+            config = BenchConfig(bulk_ingest=True)
+            config.values[("archive", "codec")] = codec
+            data_manager = DataManager(config)
+
+            start = time.perf_counter()
+            archive_path = data_manager.archive_files(datadir, backupdir)
+            elapsed = time.perf_counter() - start
+
+            ok = not os.listdir(datadir) and sum(1 for _ in iter_members(archive_path)) == count
+            size_kb = os.path.getsize(archive_path) / 1024
+            print(f"{count:>6} {codec:>8} {elapsed:>9.2f} {elapsed / count * 1000:>8.2f} {size_kb:>8.0f} {ok!s:>5}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else FILE_COUNT,
+        sys.argv[2:] or list(EXTENSIONS),
+    )
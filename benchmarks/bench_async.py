@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test of the webapp while the scraper writes: growing numbers of
+concurrent clients page through the readings API (see bench_api.py) while a
+writer process keeps ingesting batches with DataManager.
+
+The webapp runs under uvicorn in its own process, the clients are spread
+over a few processes so the client side does not cap the request rate.
+
+usage: python benchmarks/bench_async.py [readings] [concurrency...]
+"""
+
+import os
+import sys
+import time
+import statistics
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from scraper.data_manager import DataManager
+from benchmarks.bench_api import SERVER, make_database, client, wait_for_server
+from benchmarks.bench_ingest import BenchConfig, make_readings
+
+READINGS = 1_000_000
+CONCURRENCY = [8, 32, 128]
+CLIENT_PROCESSES = 4
+SECONDS = 10
+BATCH = 2_000 # readings per write of the scraper
+
+
+def writer(workdir, stop, writes):
+    """ The scraper: ingest a batch of new readings, again and again. """
+    config = BenchConfig(bulk_ingest=True)
+    config.values[("folders", "db_name")] = "bench.db"
+    data_manager = DataManager(config)
+    batch = 0
+    while not stop.is_set():
+        readings = make_readings(BATCH, 400)
+        for reading in readings:
+            reading["MeterName"] = f"W{reading['MeterName']}"
+            reading["MeterDate"] = f"2030-01-01T00:00:00-{batch:06d}-{reading['MeterDate']}"
+        data_manager.process_and_save_to_db(readings, workdir)
+        batch += 1
+    writes.value = batch
+
+
+def clients(end, threads, seconds, results):
+    deadline = time.monotonic() + seconds
+    with ThreadPoolExecutor(threads) as executor:
+        results.put([
+            latency
+            for result in executor.map(client, [end] * threads, [deadline] * threads)
+            for latency in result
+        ])
+
+
+def main(count, concurrency):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        end = make_database(db_path, count)
+
+        server = subprocess.Popen([sys.executable, "-c", SERVER], env=dict(os.environ, DB_FILE=db_path))
+        stop, writes = multiprocessing.Event(), multiprocessing.Value("i", 0)
+        scraper = multiprocessing.Process(target=writer, args=(workdir, stop, writes))
+        try:
+            wait_for_server(server)
+            scraper.start()
+
+            print(f"{'clients':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+            for total in concurrency:
+                results = multiprocessing.Queue()
+                processes = [
+                    multiprocessing.Process(target=clients, args=(end, max(1, total // CLIENT_PROCESSES), SECONDS, results))
+                    for _ in range(CLIENT_PROCESSES)
+                ]
+                for process in processes:
+                    process.start()
+                latencies = sorted(latency for _ in processes for latency in results.get())
+                for process in processes:
+                    process.join()
+
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                print(
+                    f"{total:>8} {len(latencies):>9} {len(latencies) / SECONDS:>8.0f} "
+                    f"{statistics.median(latencies) * 1000:>8.1f} {p99 * 1000:>8.1f}"
+                )
+        finally:
+            stop.set()
+            if scraper.is_alive() or scraper.exitcode is not None:
+                scraper.join()
+            server.terminate()
+            server.wait()
+        print(f"{writes.value} batches of {BATCH} readings written meanwhile")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else READINGS,
+        [int(arg) for arg in sys.argv[2:]] or CONCURRENCY,
+    )
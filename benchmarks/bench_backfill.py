@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark DataManager.backfill_archives: rebuilding the database from the
+backup archives, versus extracting every archive into the download folder and
+ingesting it like a normal run.
+
+usage: python benchmarks/bench_backfill.py [archive_count] [files_per_archive] [codec]
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from core.migration_manager import MigrationManager
+from scraper.data_manager import DataManager
+from scraper.archive_backend import iter_members
+from benchmarks.bench_ingest import BenchConfig, INIT_DB
+from benchmarks.bench_csv import meter_file_content
+
+ARCHIVE_COUNT = 20
+FILES_PER_ARCHIVE = 1_000
+
+
+def make_archives(backupdir, count, files, codec):
+    """ Write [count] run archives of [files] meter files each, one day per archive. """
+    archives = []
+    with tempfile.TemporaryDirectory() as datadir:
+        config = BenchConfig(bulk_ingest=True)
+        config.values[("archive", "codec")] = codec
+        data_manager = DataManager(config)
+        for day in range(count):
+            for meter in range(files):
+                content, name = meter_file_content(meter, day % 28)
+                content = content.replace("2023-09-", f"2023-{1 + day // 28:02d}-")
+                with open(os.path.join(datadir, f"{name}_{day:03d}.csv"), "w", encoding="utf-8") as meter_file:
+                    meter_file.write(content)
+            archive = data_manager.archive_files(datadir, backupdir)
+            renamed = os.path.join(backupdir, f"{day:03d}_{os.path.basename(archive)}")
+            os.replace(archive, renamed)
+            archives.append(renamed)
+    return archives
+
+
+def new_database(workdir):
+    db_path = os.path.join(workdir, "bench.db")
+    shutil.copy(INIT_DB, db_path)
+    MigrationManager(db_path).migrate()
+    return db_path
+
+
+def replay(archives, workdir):
+    """ The way without a backfill: extract each archive and ingest it as a run. """
+    data_manager = DataManager(BenchConfig(bulk_ingest=True))
+    datadir = os.path.join(workdir, "download")
+    os.makedirs(datadir)
+    for archive in archives:
+        for member, data in iter_members(archive):
+            with open(os.path.join(datadir, os.path.basename(member)), "wb") as meter_file:
+                meter_file.write(data)
+        data_manager.stream_csv_files_to_db(datadir, workdir, workdir)
+        for name in os.listdir(datadir):
+            os.remove(os.path.join(datadir, name))
+
+
+def backfill(archives, workdir):
+    config = BenchConfig(bulk_ingest=True)
+    config.values[("performance", "parse_workers")] = str(os.cpu_count())
+    DataManager(config).backfill_archives(archives, workdir)
+
+
+def main(count, files, codec):
+    with tempfile.TemporaryDirectory() as backupdir:
+        archives = make_archives(backupdir, count, files, codec)
+
+        print(f"{'archives':>8} {'files':>8} {'mode':>9} {'total s':>9} {'us/file':>9} {'readings':>9}")
+        for mode, load in (("replay", replay), ("backfill", backfill)):
+            with tempfile.TemporaryDirectory() as workdir:
+                db_path = new_database(workdir)
+                start = time.perf_counter()
+                load(archives, workdir)
+                elapsed = time.perf_counter() - start
+                with sqlite3.connect(db_path) as conn:
+                    readings = conn.execute("SELECT COUNT(*) FROM Readings").fetchone()[0]
+            total = count * files
+            print(f"{count:>8} {total:>8} {mode:>9} {elapsed:>9.2f} {elapsed / total * 1e6:>9.1f} {readings:>9}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_COUNT,
+        int(sys.argv[2]) if len(sys.argv) > 2 else FILES_PER_ARCHIVE,
+        sys.argv[3] if len(sys.argv) > 3 else "zip",
+    )
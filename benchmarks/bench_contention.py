@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark reads while the scraper writes: query latency of web UI style
+readers next to a writer that keeps ingesting batches of readings, with the
+classic rollback journal versus the [database] pragma profile (WAL and friends).
+
+usage: python benchmarks/bench_contention.py [seconds] [readers]
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import random
+import statistics
+import multiprocessing
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from core.database import PRAGMAS, connect
+from core.migration_manager import MigrationManager
+from scraper.data_manager import DataManager
+from benchmarks.bench_ingest import BenchConfig, INIT_DB, make_readings
+
+SECONDS = 10
+READERS = 4
+BATCH = 5_000 # readings per run of the writer
+METERS = 500
+
+PROFILES = {
+    "rollback": {"journal_mode": "delete"},
+    "tuned": PRAGMAS,
+}
+
+# the latest readings of one meter, like a page of the web UI
+QUERY = """
+SELECT m.MeterName, r.ReadingValue, r.ReadingDate
+FROM Meters m JOIN Readings r ON r.MeterID = m.MeterID
+WHERE m.MeterID = ? ORDER BY r.ReadingDate DESC LIMIT 50
+"""
+
+
+def profile_config(pragmas):
+    config = BenchConfig(bulk_ingest=True)
+    for name in PRAGMAS:
+        config.values[("database", name)] = pragmas.get(name, "")
+    return config
+
+
+def writer(workdir, pragmas, stop, results):
+    data_manager = DataManager(profile_config(pragmas))
+    timings, batch = [], 0
+    while not stop.is_set():
+        readings = make_readings(BATCH, METERS)
+        for reading in readings:
+            # a new day per batch, so every batch adds rows
+            reading["MeterDate"] = f"{reading['MeterDate']}-{batch:06d}"
+        start = time.perf_counter()
+        data_manager.process_and_save_to_db(readings, workdir)
+        timings.append(time.perf_counter() - start)
+        batch += 1
+    results.put(("write", timings, 0))
+
+
+def reader(db_path, pragmas, stop, results):
+    timings, errors = [], 0
+    conn = connect(db_path, pragmas, timeout=60)
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                conn.execute(QUERY, (random.randint(1, METERS),)).fetchall()
+            except sqlite3.OperationalError:
+                errors += 1
+                continue
+            timings.append(time.perf_counter() - start)
+    finally:
+        conn.close()
+    results.put(("read", timings, errors))
+
+
+def run(profile, seconds, readers):
+    """ Writer and readers in their own processes, as the scraper and the web app are. """
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        shutil.copy(INIT_DB, db_path)
+        pragmas = PROFILES[profile]
+        MigrationManager(db_path, pragmas).migrate()
+        DataManager(profile_config(pragmas)).process_and_save_to_db(make_readings(BATCH, METERS), workdir)
+
+        stop, results = multiprocessing.Event(), multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=writer, args=(workdir, pragmas, stop, results))]
+        processes += [multiprocessing.Process(target=reader, args=(db_path, pragmas, stop, results)) for _ in range(readers)]
+        for process in processes:
+            process.start()
+        time.sleep(seconds)
+        stop.set()
+
+        stats = {"read": [], "write": [], "errors": 0}
+        for _ in processes:
+            kind, timings, errors = results.get()
+            stats[kind] += timings
+            stats["errors"] += errors
+        for process in processes:
+            process.join()
+        return stats
+
+
+def main(seconds, readers):
+    print(f"{'profile':>9} {'reads':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} {'writes':>7} {'write ms':>9}")
+    for profile in PROFILES:
+        stats = run(profile, seconds, readers)
+        reads = sorted(stats["read"]) or [0]
+        p99 = reads[min(len(reads) - 1, int(len(reads) * 0.99))]
+        print(
+            f"{profile:>9} {len(stats['read']):>7} {statistics.median(reads) * 1000:>8.1f} {p99 * 1000:>8.1f} "
+            f"{reads[-1] * 1000:>8.1f} {stats['errors']:>7} {len(stats['write']):>7} "
+            f"{statistics.median(stats['write'] or [0]) * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        float(sys.argv[1]) if len(sys.argv) > 1 else SECONDS,
+        int(sys.argv[2]) if len(sys.argv) > 2 else READERS,
+    )
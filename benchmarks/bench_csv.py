@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark DataManager.read_csv_files over a directory of synthetic
+Socomec meter files: native reader versus pandas.read_csv, serial and
+over process/thread pools.
+
+usage: python benchmarks/bench_csv.py [file_count] [workers]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from scraper.data_manager import DataManager
+from benchmarks.bench_ingest import BenchConfig
+
+FILE_COUNT = 5_000
+ROWS_PER_FILE = 100 # a day of quarter-hour samples plus header rows
+
+
+def meter_file_content(meter, day=0):
+    """ Content of a synthetic meter file, shaped like the Socomec export. """
+    name = f"A{meter // 4:04d}_E{meter % 4:02d}@22"
+    date = f"2023-09-{day + 1:02d}T00:00:00"
+    lines = [
+        "Name,Serial,Type,Unit,Date,Status",
+        f"{name},{100000 + meter},Countis E03,kWh,{date},OK",
+        "", # blank lines are skipped when counting rows
+    ]
+    lines += [f"Info{row},-,-,-,-,-" for row in range(2, 8)]
+    lines += [f"{date},{336684 + meter * 7 + day},0,0,0,0"]
+    lines += [f"2023-09-{day + 1:02d}T{row // 4 % 24:02d}:{row % 4 * 15:02d}:00,{336684 + row},0,0,0,0" for row in range(ROWS_PER_FILE)]
+    return "\n".join(lines) + "\n", name
+
+
+def make_meter_files(datadir, count, days=1):
+    """ Write [count] synthetic meter files into [datadir]. """
+    for index in range(count):
+        meter, day = index % (count // days or 1), index // (count // days or 1)
+        content, name = meter_file_content(meter, day)
+        with open(os.path.join(datadir, f"{name}_{day:03d}.csv"), "w", encoding="utf-8") as meter_file:
+            meter_file.write(content)
+
+
+def run(config, datadir, resultdir):
+    data_manager = DataManager(config)
+    start = time.perf_counter()
+    readings = data_manager.read_csv_files(datadir, resultdir)
+    return time.perf_counter() - start, readings
+
+
+def main(count, workers):
+    with tempfile.TemporaryDirectory() as datadir, tempfile.TemporaryDirectory() as resultdir:
+        make_meter_files(datadir, count)
+
+        print(f"{'files':>8} {'engine':>8} {'pool':>12} {'total s':>10} {'us/file':>10}")
+        results = {}
+        for engine, executor, pool_workers in (
+            ("pandas", "process", 1),
+            ("native", "process", 1),
+            ("native", "thread", workers),
+            ("native", "process", workers),
+        ):
+            config = BenchConfig(bulk_ingest=True)
+            config.values[("performance", "csv_engine")] = engine
+            config.values[("performance", "parse_workers")] = str(pool_workers)
+            config.values[("performance", "parse_executor")] = executor
+            config.values[("performance", "parse_chunk_size")] = "250"
+            elapsed, results[engine, executor, pool_workers] = run(config, datadir, resultdir)
+            pool = f"{executor}x{pool_workers}" if pool_workers > 1 else "serial"
+            print(f"{count:>8} {engine:>8} {pool:>12} {elapsed:>10.3f} {elapsed / count * 1e6:>10.1f}")
+
+        native = results["native", "process", 1]
+        same = [
+            {key: str(value) for key, value in reading.items()} for reading in results["pandas", "process", 1]
+        ] == native and all(readings == native for readings in results.values() if readings is not native)
+        print(f"same readings: {same}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else FILE_COUNT,
+        int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count(),
+    )
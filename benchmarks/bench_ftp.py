@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark FTPManager.download_files against a local FTP server (pyftpdlib)
+that adds a fixed delay to every command, as a stand-in for the PPTP tunnel.
+
+usage: python benchmarks/bench_ftp.py [file_count] [latency_ms] [connections...]
+requires: pip install pyftpdlib
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from scraper.ftp_manager import FTPManager
+from benchmarks.bench_ingest import BenchConfig
+from benchmarks.bench_csv import make_meter_files
+
+FILE_COUNT = 200
+LATENCY_MS = 30
+CONNECTIONS = [1, 2, 4, 8]
+
+
+class LatencyHandler(FTPHandler):
+    """ FTPHandler that waits before answering each command. """
+    latency = LATENCY_MS / 1000
+
+    def process_command(self, cmd, *args, **kwargs):
+        time.sleep(self.latency)
+        return super().process_command(cmd, *args, **kwargs)
+
+
+def start_server(rootdir, latency):
+    authorizer = DummyAuthorizer()
+    authorizer.add_user("bench", "bench", rootdir, perm="elrd")
+    handler = type("Handler", (LatencyHandler,), {"authorizer": authorizer, "latency": latency})
+    handler.banner = "bench"
+    server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def ftp_config(port, connections):
+    config = BenchConfig(bulk_ingest=True)
+    config.values.update({
+        ("ftp", "ftp_server"): "127.0.0.1",
+        ("ftp", "ftp_port"): str(port),
+        ("ftp", "ftp_user"): "bench",
+        ("ftp", "ftp_password"): "bench",
+        ("ftp", "remote_directory"): "/",
+        ("ftp", "ftp_connections"): str(connections),
+        ("ftp", "settle_seconds"): "0", # the benchmark files are brand new
+    })
+    return config
+
+
+def main(count, latency_ms, connection_counts):
+    logging.basicConfig(level=logging.WARNING) # keeps pyftpdlib from logging every command
+    with tempfile.TemporaryDirectory() as rootdir:
+        server = start_server(rootdir, latency_ms / 1000)
+        port = server.socket.getsockname()[1]
+
+        print(f"{'files':>6} {'latency':>8} {'sessions':>9} {'total s':>9} {'ms/file':>9} {'ok':>5}")
+        for connections in connection_counts:
+            make_meter_files(rootdir, count)
+            with tempfile.TemporaryDirectory() as download_dir:
+                ftp_manager = FTPManager(ftp_config(port, connections))
+                ftp_manager.connect()
+                start = time.perf_counter()
+                downloaded = ftp_manager.download_files(download_dir)
+                elapsed = time.perf_counter() - start
+                ftp_manager.ftp.quit()
+            left = len(os.listdir(rootdir))
+            print(f"{count:>6} {latency_ms:>6}ms {connections:>9} {elapsed:>9.2f} {elapsed / count * 1000:>9.1f} {len(downloaded) == count and left == 0!s:>5}")
+
+        server.close_all()
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else FILE_COUNT,
+        int(sys.argv[2]) if len(sys.argv) > 2 else LATENCY_MS,
+        [int(arg) for arg in sys.argv[3:]] or CONNECTIONS,
+    )
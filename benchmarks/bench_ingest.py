@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark DataManager.process_and_save_to_db: per-reading cost of the
+row-by-row ingest versus the set-based bulk ingest.
+
+usage: python benchmarks/bench_ingest.py [sizes...]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# add workspace-path to the %PATH% env
+sys.path.append(".")
+
+# local modules
+from core.migration_manager import MigrationManager
+from scraper.data_manager import DataManager
+
+INIT_DB = "_init/database.db"
+SIZES = [1_000, 10_000, 100_000]
+METERS_PER_ADDRESS = 4
+
+
+class BenchConfig:
+    """ Minimal stand-in for ConfigurationManager. """
+
+    def __init__(self, bulk_ingest):
+        self.values = {
+            ("folders", "csv_result"): "result.csv",
+            ("folders", "db_name"): "bench.db",
+            ("performance", "bulk_ingest"): "yes" if bulk_ingest else "no",
+        }
+
+    def get(self, section, key, fallback=None):
+        return self.values.get((section, key), fallback)
+
+    def getint(self, section, key, fallback=None):
+        return int(self.get(section, key, fallback))
+
+    def getboolean(self, section, key, fallback=None):
+        value = self.get(section, key, fallback)
+        return value if isinstance(value, bool) else value == "yes"
+
+
+def make_readings(count, meters):
+    """ Build [count] readings spread over [meters] meters, one per meter per day. """
+    readings = []
+    for i in range(count):
+        meter, day = i % meters, i // meters
+        address = f"A{meter // METERS_PER_ADDRESS:04d}"
+        readings.append(
+            {
+                "MeterName": f"{address}_E{meter % METERS_PER_ADDRESS:02d}@22",
+                "AddressName": address,
+                "MeterValue": 100_000 + day * 10 + meter,
+                "MeterDate": f"2023-01-01T00:00:00+{day:05d}",
+            }
+        )
+    return readings
+
+
+def run(bulk_ingest, readings, workdir):
+    shutil.copy(INIT_DB, os.path.join(workdir, "bench.db"))
+    MigrationManager(os.path.join(workdir, "bench.db")).migrate()
+    data_manager = DataManager(BenchConfig(bulk_ingest))
+
+    start = time.perf_counter()
+    data_manager.process_and_save_to_db(readings, workdir)
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    print(f"{'readings':>10} {'mode':>6} {'total s':>10} {'us/reading':>12}")
+    for size in sizes:
+        readings = make_readings(size, meters=max(1, size // 10))
+        for bulk_ingest in (False, True):
+            with tempfile.TemporaryDirectory() as workdir:
+                elapsed = run(bulk_ingest, readings, workdir)
+            mode = "bulk" if bulk_ingest else "row"
+            print(f"{size:>10} {mode:>6} {elapsed:>10.3f} {elapsed / size * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
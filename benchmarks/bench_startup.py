@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the import time of the scraper entry point with `python -X importtime`
+and fail when it goes over a budget, or when a heavy module is imported at startup.
+
+The entry point plus the modules every run needs (DataManager, VPNManager,
+FTPManager) are imported in a fresh interpreter; the median over a few runs is
+compared with the budget.
+
+usage: python benchmarks/bench_startup.py [budget_ms] [runs]
+"""
+
+import sys
+import statistics
+import subprocess
+
+BUDGET_MS = 120 # about 85 ms here with the lazy imports, 170 ms without
+RUNS = 5
+MARKER = "--- entry point ---"
+
+# loaded lazily by the stages that need them; a top-level import is a regression
+HEAVY_MODULES = ["pandas", "py7zr", "smtplib", "asyncio"]
+
+ENTRY_POINT = f"""
+import sys, importlib.util
+sys.path.insert(0, ".")
+sys.stderr.write("{MARKER}\\n")
+spec = importlib.util.spec_from_file_location("scraper_entry", "scraper.py")
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+import scraper.data_manager, scraper.vpn_manager, scraper.ftp_manager
+"""
+
+
+def import_times():
+    """
+    Import the entry point in a fresh interpreter.
+
+    Returns:
+        tuple: (top-level module -> cumulative import time in microseconds, set of all imported modules)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", ENTRY_POINT],
+        stderr=subprocess.PIPE, text=True, check=True,
+    )
+    _, _, lines = result.stderr.partition(MARKER)
+
+    times, modules = {}, set()
+    for line in lines.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):  # top-level imports only, nested ones are in the cumulative time
+            times[name.strip()] = int(cumulative)
+    return times, modules
+
+
+def main(budget_ms, runs):
+    samples = [import_times() for _ in range(runs)]
+    totals_ms = [sum(times.values()) / 1000 for times, _ in samples]
+    median_ms = statistics.median(totals_ms)
+
+    last, modules = samples[-1]
+    print(f"{'module':<40} {'ms':>8}")
+    for name, cumulative in sorted(last.items(), key=lambda item: -item[1])[:10]:
+        print(f"{name:<40} {cumulative / 1000:>8.1f}")
+    print(f"{'total (median of ' + str(runs) + ')':<40} {median_ms:>8.1f}   budget {budget_ms} ms")
+
+    loaded = {name.split(".")[0] for name in modules}
+    heavy = [module for module in HEAVY_MODULES if module in loaded]
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(heavy)}")
+    if median_ms > budget_ms:
+        print("FAIL: over budget")
+    return 1 if heavy or median_ms > budget_ms else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(
+        float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS,
+        int(sys.argv[2]) if len(sys.argv) > 2 else RUNS,
+    ))
@@ -11,12 +11,15 @@ import logging
 from pathlib import Path
 
 CONFIGFILE = 'socomec.ini'
+_UNSET = object() # marker for 'no fallback given'
 
 """
 Singleton class for global configuration
 
 Methods:
     get(key): get value for [key].
+    getint(key): get value for [key] as int.
+    getboolean(key): get value for [key] as bool.
     get_sections(): Returns all section names.
     get_options(section): Return options for [section].
     read_file(filename): Parse and read content of [filename].
@@ -41,15 +44,29 @@ class ConfigurationManager:
 
         return cls._instances[config_file]
 
-    def get(self, section, key):
+    def get(self, section, key, fallback=_UNSET):
         try:
             value = self._config.get(section, key)
             logging.info(f"Retrieved config value: Section='{section}', Key='{key}'")
             return value
-        except configparser.NoOptionError:
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            if fallback is not _UNSET:
+                logging.info(f"Using default config value: Section='{section}', Key='{key}'")
+                return fallback
             logging.error(f"Key '{key}' not found in section '{section}'")
             raise KeyError(f"Key '{key}' not found in section '{section}'")
 
+    def getint(self, section, key, fallback=_UNSET):
+        return int(self.get(section, key, fallback))
+
+    def getboolean(self, section, key, fallback=_UNSET):
+        value = self.get(section, key, fallback)
+        if isinstance(value, bool):
+            return value
+        if value.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+            raise ValueError(f"Not a boolean: Section='{section}', Key='{key}'")
+        return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+
     def get_sections(self):
         sections = self._config.sections()
         logging.info(f"Retrieved configuration sections: {sections}")
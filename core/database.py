@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite connections with the pragma profile of the [database] section.
+"""
+
+import sqlite3
+import logging
+
+# [database] option -> pragma default; an empty value in the ini-file keeps the SQLite default
+PRAGMAS = {
+    "journal_mode": "wal",      # readers do not wait for the writer, nor the writer for readers
+    "synchronous": "normal",    # with wal: no fsync per commit, still safe against corruption
+    "cache_size": "-65536",     # page cache per connection, negative: in KiB (64 MB)
+    "mmap_size": "268435456",   # read pages through a memory map of up to 256 MB
+    "temp_store": "memory",     # temporary tables and sort files in memory
+}
+TIMEOUT_SECONDS = 20 # wait for a lock this long before 'database is locked'
+
+
+def database_pragmas(config):
+    """
+    Read the pragma profile from the [database] section.
+
+    Args:
+        config (ConfigurationManager): The configuration.
+
+    Returns:
+        dict: pragma -> value, without the pragmas left empty.
+    """
+    pragmas = {}
+    for name, default in PRAGMAS.items():
+        value = config.get("database", name, default).strip()
+        if value:
+            pragmas[name] = value
+    return pragmas
+
+
+def apply_pragmas(conn, pragmas):
+    """
+    Set the pragmas on a new connection, before its first transaction.
+
+    Also works on the DBAPI connection of a SQLAlchemy engine.
+
+    Args:
+        conn: An sqlite3 connection.
+        pragmas (dict): pragma -> value, see database_pragmas.
+
+    Returns:
+        None
+    """
+    cursor = conn.cursor()
+    try:
+        for name, value in pragmas.items():
+            if name not in PRAGMAS or not value.lstrip("-").isalnum():
+                raise ValueError(f"Invalid database pragma: {name} = {value}")
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if pragmas.get("journal_mode", "").lower() == "wal":
+            mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+            if mode != "wal":
+                # e.g. a network share; the rollback journal still works
+                logging.warning(f"Database stays in journal_mode {mode}")
+    finally:
+        cursor.close()
+
+
+def connect(db_path, pragmas=None, timeout=TIMEOUT_SECONDS, **kwargs):
+    """
+    Open a connection to the database with the pragma profile applied.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        pragmas (dict): pragma -> value, see database_pragmas; None for the defaults.
+        timeout (float): Seconds to wait for a lock.
+        **kwargs: Passed on to sqlite3.connect, e.g. isolation_level.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, **kwargs)
+    try:
+        apply_pragmas(conn, PRAGMAS if pragmas is None else pragmas)
+    except Exception:
+        conn.close()
+        raise
+    return conn
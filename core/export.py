@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming export of the readings as CSV, NDJSON or Parquet.
+"""
+
+import io
+import csv
+import json
+
+EXPORT_COLUMNS = ["AddressText", "MeterName", "ReadingDate", "ReadingValue"]
+EXPORT_BATCH = 10000 # rows fetched from the cursor and encoded at a time
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "ndjson": ("application/x-ndjson", ".ndjson"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"), # needs pyarrow
+}
+
+
+def iter_export_rows(conn, since=None, until=None, meter=None, address=None, batch=EXPORT_BATCH):
+    """
+    Stream readings with their meter and address, in (MeterID, ReadingDate) order.
+
+    The rows come from the cursor in batches; the order is the order of the
+    MeterReadingDateValue index, so SQLite needs no sort and memory use does
+    not grow with the size of the export.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        since (str): Optional first reading date, e.g. 2023-09-01.
+        until (str): Optional end of the range, exclusive.
+        meter (str): Optional meter name.
+        address (str): Optional address text.
+        batch (int): Rows per batch.
+
+    Yields:
+        list: A batch of (AddressText, MeterName, ReadingDate, ReadingValue) rows.
+    """
+    meters, conditions, params = ["1"], [], []
+    if meter:
+        meters.append("m.MeterName = ?")
+        params.append(meter)
+    if address:
+        meters.append("a.AddressText = ?")
+        params.append(address)
+    if since:
+        conditions.append("r.ReadingDate >= ?")
+        params.append(since)
+    if until:
+        conditions.append("r.ReadingDate < ?")
+        params.append(until)
+
+    # the readings are looked up per meter, so the date range bounds every index seek
+    cursor = conn.execute(
+        "SELECT a.AddressText, m.MeterName, r.ReadingDate, r.ReadingValue "
+        "FROM Readings r "
+        "JOIN Meters m ON m.MeterID = r.MeterID "
+        "JOIN Addresses a ON a.AddressID = m.AddressID "
+        "WHERE r.MeterID IN ("
+        "    SELECT m.MeterID FROM Meters m JOIN Addresses a ON a.AddressID = m.AddressID "
+        f"   WHERE {' AND '.join(meters)}) "
+        + "".join(f"AND {condition} " for condition in conditions)
+        + "ORDER BY r.MeterID, r.ReadingDate",
+        params,
+    )
+    try:
+        while rows := cursor.fetchmany(batch):
+            yield rows
+    finally:
+        cursor.close()
+
+
+def encode_csv(batches):
+    """ CSV with a header row, one chunk of bytes per batch. """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # only the header: an empty export
+        yield buffer.getvalue().encode("utf-8")
+
+
+def encode_ndjson(batches):
+    """ One JSON object per line, one chunk of bytes per batch. """
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows).encode("utf-8")
+
+
+class _ChunkSink:
+    """
+    Write-only file for pyarrow that hands out what was written since the last
+    take(); the position keeps counting, the Parquet footer refers to it.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def encode_parquet(batches):
+    """ Parquet with one row group per batch, streamed as the row groups are written. """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("AddressText", pa.string()),
+        ("MeterName", pa.string()),
+        ("ReadingDate", pa.string()),
+        ("ReadingValue", pa.int64()),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd") as writer:
+        for rows in batches:
+            columns = zip(*rows)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.take()
+    yield sink.take()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "parquet": encode_parquet,
+}
+
+
+def check_export_format(export_format):
+    """
+    Check that [export_format] can be written here.
+
+    Raises:
+        ValueError: For an unknown format, or parquet without pyarrow.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("The parquet export needs pyarrow: pip install pyarrow")
+
+
+def iter_export(conn, export_format, **filters):
+    """
+    Stream an export of the readings as chunks of bytes.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        export_format (str): Key in EXPORT_FORMATS.
+        **filters: since, until, meter and address, see iter_export_rows.
+
+    Yields:
+        bytes: The next part of the file.
+    """
+    check_export_format(export_format)
+    yield from ENCODERS[export_format](iter_export_rows(conn, **filters))
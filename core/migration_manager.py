@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Versioned schema migrations of the scraper database, tracked in PRAGMA user_version.
+"""
+
+import sqlite3
+import logging
+
+# local modules
+from core.database import connect
+
+# indexes on Readings, also dropped and built again in one go by DataManager.backfill_archives
+READING_INDEXES = {
+    "MeterReadingDate": "CREATE UNIQUE INDEX IF NOT EXISTS MeterReadingDate ON Readings (MeterID, ReadingDate)",
+    "MeterReadingDateValue": "CREATE INDEX IF NOT EXISTS MeterReadingDateValue ON Readings (MeterID, ReadingDate, ReadingValue)",
+}
+
+# meters whose daily consumption is computed again from FromDay on, see refresh_daily_consumption
+CONSUMPTION_DIRTY = "CREATE TEMP TABLE IF NOT EXISTS ConsumptionDirty (MeterID INTEGER PRIMARY KEY, FromDay TEXT NOT NULL)"
+
+
+def refresh_daily_consumption(cursor):
+    """
+    Compute DailyConsumption again for the meters and days in temp.ConsumptionDirty.
+
+    The rows of a meter from FromDay on are replaced: the last reading per
+    day, the difference with the previous day that has readings, and the
+    running total continued from the last row before FromDay. Empties
+    temp.ConsumptionDirty. Runs inside the caller's transaction.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the database.
+
+    Returns:
+        None
+    """
+    cursor.executemany(
+        "DELETE FROM DailyConsumption WHERE MeterID = ? AND Day >= ?",
+        cursor.execute("SELECT MeterID, FromDay FROM temp.ConsumptionDirty").fetchall(),
+    )
+    cursor.execute(
+        "INSERT INTO DailyConsumption (MeterID, Day, LastValue, Delta, Cumulative) "
+        "WITH Days AS ("
+        # the last reading per meter and day; SQLite takes the bare column from the MAX row
+        "    SELECT r.MeterID, substr(r.ReadingDate, 1, 10) AS Day, r.ReadingValue AS LastValue, MAX(r.ReadingDate) "
+        "    FROM temp.ConsumptionDirty d JOIN Readings r ON r.MeterID = d.MeterID AND r.ReadingDate >= d.FromDay "
+        "    GROUP BY r.MeterID, Day"
+        "), Base AS ("
+        # the last day before the recomputed range carries the running total
+        "    SELECT c.MeterID, c.Day, c.LastValue, c.Cumulative "
+        "    FROM temp.ConsumptionDirty d JOIN DailyConsumption c ON c.MeterID = d.MeterID "
+        "    AND c.Day = (SELECT MAX(Day) FROM DailyConsumption WHERE MeterID = d.MeterID AND Day < d.FromDay)"
+        "), Steps AS ("
+        "    SELECT MeterID, Day, LastValue, IsBase, Seed, "
+        "    LastValue - COALESCE(LAG(LastValue) OVER (PARTITION BY MeterID ORDER BY Day), LastValue) AS Delta "
+        "    FROM (SELECT MeterID, Day, LastValue, 1 AS IsBase, Cumulative AS Seed FROM Base "
+        "          UNION ALL SELECT MeterID, Day, LastValue, 0, 0 FROM Days)"
+        ") "
+        "SELECT MeterID, Day, LastValue, Delta, Cumulative FROM ("
+        "    SELECT MeterID, Day, LastValue, IsBase, Delta, "
+        "    SUM(CASE WHEN IsBase THEN Seed ELSE Delta END) OVER (PARTITION BY MeterID ORDER BY Day) AS Cumulative "
+        "    FROM Steps"
+        ") WHERE NOT IsBase"
+    )
+    cursor.execute("DELETE FROM temp.ConsumptionDirty")
+
+
+def _has_unique_index(cursor, table, column):
+    """
+    Check if [table] already has a unique index on exactly [column].
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the database.
+        table (str): Table name.
+        column (str): Column name.
+
+    Returns:
+        bool: True if such an index exists, False otherwise.
+    """
+    for _, index_name, unique, *_ in cursor.execute(f"PRAGMA index_list({table})").fetchall():
+        if unique:
+            columns = [row[2] for row in cursor.execute(f"PRAGMA index_info({index_name})").fetchall()]
+            if columns == [column]:
+                return True
+    return False
+
+
+def _migrate_unique_dimensions(cursor):
+    """
+    Deduplicate Addresses and Meters, remap their references and add
+    the unique and covering indexes used by the ingest and docs/queries.sql.
+    """
+    # Step 1: Keep the lowest AddressID per AddressText and remap Meters.AddressID
+    cursor.execute(
+        "CREATE TEMP TABLE AddressMap (OldID INTEGER PRIMARY KEY, KeepID INT)"
+    )
+    cursor.execute(
+        "INSERT INTO temp.AddressMap (OldID, KeepID) "
+        "SELECT a.AddressID, k.KeepID FROM Addresses a "
+        "JOIN (SELECT AddressText, MIN(AddressID) AS KeepID FROM Addresses GROUP BY AddressText) k "
+        "ON a.AddressText = k.AddressText WHERE a.AddressID <> k.KeepID"
+    )
+    cursor.execute(
+        "UPDATE Meters SET AddressID = (SELECT KeepID FROM temp.AddressMap WHERE OldID = Meters.AddressID) "
+        "WHERE AddressID IN (SELECT OldID FROM temp.AddressMap)"
+    )
+    cursor.execute("DELETE FROM Addresses WHERE AddressID IN (SELECT OldID FROM temp.AddressMap)")
+    logging.info(f"Removed {cursor.rowcount} duplicate addresses")
+
+    # Step 2: Keep the lowest MeterID per MeterName and remap Readings.MeterID
+    cursor.execute(
+        "CREATE TEMP TABLE MeterMap (OldID INTEGER PRIMARY KEY, KeepID INT)"
+    )
+    cursor.execute(
+        "INSERT INTO temp.MeterMap (OldID, KeepID) "
+        "SELECT m.MeterID, k.KeepID FROM Meters m "
+        "JOIN (SELECT MeterName, MIN(MeterID) AS KeepID FROM Meters GROUP BY MeterName) k "
+        "ON m.MeterName = k.MeterName WHERE m.MeterID <> k.KeepID"
+    )
+    # readings that would collide with a reading of the kept meter are left behind and removed
+    cursor.execute(
+        "UPDATE OR IGNORE Readings SET MeterID = (SELECT KeepID FROM temp.MeterMap WHERE OldID = Readings.MeterID) "
+        "WHERE MeterID IN (SELECT OldID FROM temp.MeterMap)"
+    )
+    cursor.execute("DELETE FROM Readings WHERE MeterID IN (SELECT OldID FROM temp.MeterMap)")
+    cursor.execute("DELETE FROM Meters WHERE MeterID IN (SELECT OldID FROM temp.MeterMap)")
+    logging.info(f"Removed {cursor.rowcount} duplicate meters")
+
+    cursor.execute("DROP TABLE temp.AddressMap")
+    cursor.execute("DROP TABLE temp.MeterMap")
+
+    # Step 3: Remove duplicate readings in databases without the MeterReadingDate index
+    cursor.execute(
+        "DELETE FROM Readings WHERE ReadingID NOT IN "
+        "(SELECT MIN(ReadingID) FROM Readings GROUP BY MeterID, ReadingDate)"
+    )
+
+    # Step 4: Unique indexes, unless the table was created with a UNIQUE column
+    if not _has_unique_index(cursor, "Addresses", "AddressText"):
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS AddressTextUnique ON Addresses (AddressText)")
+    if not _has_unique_index(cursor, "Meters", "MeterName"):
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS MeterNameUnique ON Meters (MeterName)")
+    cursor.execute(READING_INDEXES["MeterReadingDate"])
+
+    # Step 5: Covering indexes for the address -> meters join and the reading lookups
+    cursor.execute("CREATE INDEX IF NOT EXISTS MeterAddress ON Meters (AddressID, MeterName)")
+    cursor.execute(READING_INDEXES["MeterReadingDateValue"])
+
+
+def _migrate_ingested_files(cursor):
+    """
+    Add the manifest of ingested meter files.
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS IngestedFiles ("
+        "FileName VARCHAR(255) PRIMARY KEY, "
+        "FileSize INT NOT NULL, "
+        "FileMTime INT NOT NULL, "
+        "ContentHash VARCHAR(64) NOT NULL, "
+        "IngestedAt DATETIME NOT NULL)"
+    )
+
+
+def _migrate_daily_consumption(cursor):
+    """
+    Add DailyConsumption, the usage per meter and day, and fill it from Readings.
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS DailyConsumption ("
+        "MeterID INT NOT NULL, "
+        "Day DATE NOT NULL, "
+        "LastValue INT NOT NULL, "
+        "Delta INT NOT NULL, "
+        "Cumulative INT NOT NULL, "
+        "PRIMARY KEY (MeterID, Day)) WITHOUT ROWID"
+    )
+    cursor.execute(CONSUMPTION_DIRTY)
+    cursor.execute("INSERT OR REPLACE INTO temp.ConsumptionDirty (MeterID, FromDay) SELECT MeterID, '' FROM Meters")
+    refresh_daily_consumption(cursor)
+
+
+def _migrate_data_version(cursor):
+    """
+    Add the data version, bumped by every ingest transaction; the webapp cache keys on it.
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS DataVersion ("
+        "ID INTEGER PRIMARY KEY CHECK (ID = 1), "
+        "Version INT NOT NULL)"
+    )
+    cursor.execute("INSERT OR IGNORE INTO DataVersion (ID, Version) VALUES (1, 0)")
+
+
+class MigrationManager:
+    """
+    Brings the database schema up to date, tracked with PRAGMA user_version.
+
+    Each migration runs in its own transaction together with its version bump,
+    so an interrupted migration is retried on the next start.
+    """
+
+    # (version, description, function(cursor)), in order
+    MIGRATIONS = [
+        (1, "unique addresses and meters, covering indexes", _migrate_unique_dimensions),
+        (2, "manifest of ingested files", _migrate_ingested_files),
+        (3, "daily consumption per meter", _migrate_daily_consumption),
+        (4, "data version", _migrate_data_version),
+    ]
+
+    def __init__(self, db_path, pragmas=None):
+        """
+        Initialize the MigrationManager.
+
+        Args:
+            db_path (str): Path to the SQLite database.
+            pragmas (dict): Pragma profile, see core.database; None for the defaults.
+
+        Returns:
+            None
+        """
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.timeout_seconds = 20
+        logging.info(self.__class__.__name__)
+
+    def migrate(self):
+        """
+        Run all migrations newer than the version of the database.
+
+        Returns:
+            int: The schema version after migrating.
+        """
+        conn = connect(self.db_path, self.pragmas, self.timeout_seconds, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+            for target, description, migration in self.MIGRATIONS:
+                if target <= version:
+                    continue
+
+                logging.info(f"Migrating database to version {target}: {description}")
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    migration(cursor)
+                    cursor.execute(f"PRAGMA user_version = {target}")
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+                version = target
+
+            cursor.execute("PRAGMA optimize")
+            return version
+        except sqlite3.Error as e:
+            logging.error(f"An error occurred while migrating the database: {e}")
+            raise
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    print(MigrationManager(sys.argv[1]).migrate())
@@ -1,13 +1,13 @@
 -- Create the Addresses table
 CREATE TABLE Addresses (
     AddressID INTEGER PRIMARY KEY AUTOINCREMENT,
-    AddressText VARCHAR(255) NOT NULL
+    AddressText VARCHAR(255) NOT NULL UNIQUE
 );
 
 -- Create the Meters table
 CREATE TABLE Meters (
     MeterID INTEGER PRIMARY KEY AUTOINCREMENT,
-    MeterName VARCHAR(255),
+    MeterName VARCHAR(255) UNIQUE,
     AddressID INT,
     FOREIGN KEY (AddressID) REFERENCES Addresses(AddressID)
 );
@@ -21,4 +21,37 @@ CREATE TABLE Readings (
     FOREIGN KEY (MeterID) REFERENCES Meters(MeterID)
 );
 
-CREATE UNIQUE INDEX IF NOT EXISTS MeterReadingDate on Readings (MeterID, ReadingDate)
+CREATE UNIQUE INDEX IF NOT EXISTS MeterReadingDate on Readings (MeterID, ReadingDate);
+
+-- Covering indexes for the address -> meters join and the reading lookups in queries.sql
+CREATE INDEX IF NOT EXISTS MeterAddress on Meters (AddressID, MeterName);
+CREATE INDEX IF NOT EXISTS MeterReadingDateValue on Readings (MeterID, ReadingDate, ReadingValue);
+
+-- Create the IngestedFiles table, the manifest of meter files already in Readings
+CREATE TABLE IngestedFiles (
+    FileName VARCHAR(255) PRIMARY KEY,
+    FileSize INT NOT NULL,
+    FileMTime INT NOT NULL, -- nanoseconds
+    ContentHash VARCHAR(64) NOT NULL, -- sha256
+    IngestedAt DATETIME NOT NULL
+);
+
+-- Create the DailyConsumption table, kept up to date by the ingest
+CREATE TABLE DailyConsumption (
+    MeterID INT NOT NULL,
+    Day DATE NOT NULL, -- YYYY-MM-DD
+    LastValue INT NOT NULL, -- the last reading of the day
+    Delta INT NOT NULL, -- LastValue minus LastValue of the previous day with readings
+    Cumulative INT NOT NULL, -- sum of Delta since the first reading of the meter
+    PRIMARY KEY (MeterID, Day)
+) WITHOUT ROWID;
+
+-- Create the DataVersion table, one row bumped by every ingest transaction
+CREATE TABLE DataVersion (
+    ID INTEGER PRIMARY KEY CHECK (ID = 1),
+    Version INT NOT NULL
+);
+INSERT INTO DataVersion (ID, Version) VALUES (1, 0);
+
+-- Schema version, see core/migration_manager.py
+PRAGMA user_version = 4;
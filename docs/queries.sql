@@ -72,6 +72,29 @@ FROM
     StartEndReadings;
 
 
+--
+-- The same usage from DailyConsumption: a range sum over the days after StartDate up to EndDate
+-- (the Delta of a day is its usage since the previous reading)
+--
+
+SELECT
+    m.MeterID,
+    m.MeterName,
+    SUM(c.Delta) AS ReadingValueDifference
+FROM
+    Meters m
+JOIN
+    Addresses a ON m.AddressID = a.AddressID
+JOIN
+    DailyConsumption c ON c.MeterID = m.MeterID
+        AND c.Day > '2023-09-01' -- Replace with the desired StartDate
+        AND c.Day <= '2023-09-10' -- Replace with the desired EndDate
+WHERE
+    a.AddressText = 'A19'  -- Replace with the desired AddressText
+GROUP BY
+    m.MeterID, m.MeterName;
+
+
 --
 -- Get latest ReadingValue(s) for given AddressText
 --
@@ -7,6 +7,7 @@ Created on Tue Sep 26 16:59:56 2023
 
 import os
 import logging
+import argparse
 from pathlib import Path
 import time
 
@@ -19,18 +20,58 @@ import time
 from core.logging_manager import setup_logging
 from core.configuration_manager import ConfigurationManager
 from core.init_manager import InitManager
+from core.migration_manager import MigrationManager
+from core.database import database_pragmas
 from core.utils import canonical_path
 
-from scraper.vpn_manager import VPNManager
-from scraper.ftp_manager import FTPManager
-from scraper.email_manager import EmailManager
-from scraper.data_manager import DataManager
+# the scraper modules (py7zr, smtplib, asyncio, ...) are imported where their
+# stage runs, so a run that finds nothing to do does not pay for them;
+# benchmarks/bench_startup.py keeps an eye on the startup time
 
 INI_FILE = "socomec.ini" # default ini file
 INIT_FOLDER = "setup/" # contains folder structure and empty database for setup
 BASE_FOLDER = "mnt/" # the root for all data, backup and logs
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect the Socomec meter readings.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--daemon",
+        action="store_true",
+        help="stay resident and poll the FTP server, see the [daemon] section of the ini-file",
+    )
+    mode.add_argument(
+        "--compact",
+        action="store_true",
+        help="merge the backup archives of past days and months, and update the archive index",
+    )
+    mode.add_argument(
+        "--extract",
+        nargs="*",
+        metavar="FILE",
+        help="copy files out of the backup archives, selected by name and/or --meter and --date",
+    )
+    mode.add_argument(
+        "--backfill",
+        nargs="*",
+        metavar="ARCHIVE",
+        help="load the readings of backup archives into the database (default: all archives in the backup folder)",
+    )
+    mode.add_argument(
+        "--export",
+        choices=["csv", "ndjson", "parquet"],
+        help="write the readings to a file, selected by --meter, --address, --since and --until (parquet needs pyarrow)",
+    )
+    parser.add_argument("--meter", help="with --extract or --export: the meter name, e.g. A14_E03@22")
+    parser.add_argument("--date", help="with --extract: the reading date or its start, e.g. 2023-09")
+    parser.add_argument("--address", help="with --export: the address, e.g. A14")
+    parser.add_argument("--since", help="with --export: the first reading date, e.g. 2023-09-01")
+    parser.add_argument("--until", help="with --export: the end of the range (exclusive), e.g. 2023-10-01")
+    parser.add_argument("--output", default=".", help="with --extract: the directory for the files; with --export: the file or directory")
+    args = parser.parse_args(argv)
+    if args.extract == [] and not (args.meter or args.date):
+        parser.error("--extract needs file names, --meter or --date")
+
     # setup the path to the working directory for local and docker use
     local_base_dir = Path(os.getcwd()).resolve().parents[0] # parent dir of current project path
     local_base_dir = canonical_path(os.path.join(local_base_dir, BASE_FOLDER)) # the root for all data, logs and configs
@@ -52,28 +93,95 @@ def main():
 
     data_dir = canonical_path(os.path.join(base_dir, config.get("folders","download_folder")))
     backup_dir = canonical_path(os.path.join(base_dir, config.get("folders","backup_folder")))
-    
+    db_path = canonical_path(os.path.join(base_dir, config.get("folders","db_name")))
+
+    vpn_manager = None
     try:
+        # bring the database schema up to date
+        migration_manager = MigrationManager(db_path, database_pragmas(config))
+        migration_manager.migrate()
+
+        if args.daemon:
+            from scraper.daemon import ScraperDaemon
+            ScraperDaemon(config, base_dir, data_dir, backup_dir).run()
+            return
+
+        if args.compact or args.extract is not None:
+            from scraper.archive_compactor import ArchiveCompactor
+            compactor = ArchiveCompactor(config, backup_dir)
+            if args.compact:
+                compactor.compact()
+            else:
+                entries = compactor.find(args.extract, args.meter, args.date)
+                for path in compactor.extract(entries, args.output):
+                    print(path)
+            return
+
+        if args.backfill is not None:
+            from scraper.data_manager import DataManager
+            from scraper.archive_backend import is_archive
+            archives = args.backfill or [
+                os.path.join(backup_dir, name)
+                for name in sorted(os.listdir(backup_dir))
+                if is_archive(name) and not name.startswith(".") # skip archives being written
+            ]
+            DataManager(config).backfill_archives(archives, base_dir)
+            return
+
+        if args.export:
+            from core.database import connect
+            from core.export import EXPORT_FORMATS, check_export_format, iter_export
+            check_export_format(args.export)
+            output = args.output
+            if os.path.isdir(output):
+                output = os.path.join(output, "readings" + EXPORT_FORMATS[args.export][1])
+            conn = connect(db_path, database_pragmas(config))
+            try:
+                with open(output, "wb") as export_file:
+                    for chunk in iter_export(conn, args.export, since=args.since, until=args.until, meter=args.meter, address=args.address):
+                        export_file.write(chunk)
+            finally:
+                conn.close()
+            print(output)
+            return
+
+        if config.get("performance", "engine", "sync") == "async":
+            # the same run, with the stages overlapping
+            import asyncio
+            from scraper.async_engine import AsyncEngine
+            asyncio.run(AsyncEngine(config, base_dir, data_dir, backup_dir).run())
+            return
+
+        from scraper.data_manager import DataManager
         data_manager = DataManager(config)
 
-        reading_list = []
-
         # empty (process+archive) the download folder before downloading a new batch
         if data_manager.local_has_csv(data_dir):
-            reading_list = data_manager.read_csv_files(data_dir, base_dir)
-            data_manager.process_and_save_to_db(reading_list, base_dir)
-            data_manager.archive_files(data_dir, backup_dir)
-            reading_list = []
+            data_manager.stream_csv_files_to_db(data_dir, base_dir, base_dir)
+            data_manager.archive_files(data_dir, backup_dir, base_dir)
 
-        vpn_manager = VPNManager(config)
+        from scraper.vpn_manager import VPNManager
+        vpn_manager = VPNManager(config, base_dir)
         if vpn_manager.connect():
+            from scraper.ftp_manager import FTPManager
             ftp_manager = FTPManager(config)
             if ftp_manager.connect():
-                if ftp_manager.download_files(data_dir):
+                # files the manifest already holds are not transferred again
+                known_files = lambda names: data_manager.ingested_files(base_dir, names)
+
+                if ftp_manager.transfer_mode == "memory":
+                    # parse, store and archive straight from the download buffers
+                    downloaded = data_manager.ingest_buffers(ftp_manager.fetch_files(known_files), base_dir, base_dir, backup_dir)
+                    ftp_manager.delete_remote_files(downloaded)
+                else:
+                    downloaded = ftp_manager.download_files(data_dir, known_files)
+                    if downloaded:
+                        data_manager.stream_csv_files_to_db(data_dir, base_dir, base_dir)
+                        data_manager.archive_files(data_dir, backup_dir, base_dir)
+
+                if downloaded:
+                    from scraper.email_manager import EmailManager
                     email_manager = EmailManager(config)
-                    reading_list = data_manager.read_csv_files(data_dir, base_dir)
-                    data_manager.process_and_save_to_db(reading_list, base_dir)
-                    data_manager.archive_files(data_dir, backup_dir)
                     attachme = os.path.join(
                         base_dir,
                         config.get("folders", "csv_result")
@@ -84,10 +192,17 @@ def main():
         else:
             logging.error(f'Cannot connect to vpn ({vpn_manager.vpn_name})')
 
+        # merge the run archives of past days, see the [archive] section
+        from scraper.archive_compactor import ArchiveCompactor
+        compactor = ArchiveCompactor(config, backup_dir)
+        if compactor.auto_compact:
+            compactor.compact()
+
     except Exception as e:
         logging.error(f"An error occurred: {e}")
     finally:
-        vpn_manager.disconnect()
+        if vpn_manager:
+            vpn_manager.disconnect()
         logging.info("** *** *** *** *** *** *** *** *** **")
 
 
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Writers and readers of the backup archives, one per [archive] codec.
+"""
+
+import io
+import os
+import time
+import queue
+import tarfile
+import zipfile
+import itertools
+import threading
+
+# [archive] codec -> file extension
+EXTENSIONS = {
+    "7z": ".7z",        # LZMA2, smallest, slowest (py7zr)
+    "7z-zstd": ".7z",   # zstd inside 7z (py7zr)
+    "zip": ".zip",      # deflate, fast, readable everywhere
+    "tar.zst": ".tar.zst", # zstd with worker threads, fastest on big backlogs
+}
+MEMBER_QUEUE = 64 # members decompressed ahead of the reader of a 7z archive
+
+
+def _zstd():
+    """ The zstd module: compression.zstd (Python 3.14+) or the backports.zstd package. """
+    try:
+        from compression import zstd
+    except ImportError:
+        from backports import zstd
+    return zstd
+
+
+def is_archive(filename):
+    """
+    Check if [filename] is a backup archive of a supported format.
+
+    Args:
+        filename (str): File name or path.
+
+    Returns:
+        bool: True for .7z, .zip and .tar.zst files.
+    """
+    return filename.endswith(tuple(set(EXTENSIONS.values())))
+
+
+class _Archive:
+    """
+    Common interface of the archive writers, modelled on py7zr.SevenZipFile:
+    write(path, arcname), writestr(data, arcname), close() and filename.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _ZipArchive(_Archive):
+    def __init__(self, path, level):
+        self.filename = path
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=level)
+
+    def write(self, path, arcname):
+        self._zip.write(path, arcname)
+
+    def writestr(self, data, arcname):
+        self._zip.writestr(arcname, data)
+
+    def close(self):
+        self._zip.close()
+
+
+class _TarZstdArchive(_Archive):
+    def __init__(self, path, level, threads):
+        zstd = _zstd()
+        options = {zstd.CompressionParameter.nb_workers: threads}
+        if level is not None:
+            options[zstd.CompressionParameter.compression_level] = level
+        self.filename = path
+        self._file = zstd.ZstdFile(path, "w", options=options)
+        self._tar = tarfile.open(fileobj=self._file, mode="w|")
+
+    def write(self, path, arcname):
+        self._tar.add(path, arcname, recursive=False)
+
+    def writestr(self, data, arcname):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        try:
+            self._tar.close()
+        finally:
+            self._file.close()
+
+
+def open_archive(path, codec="7z", level=None, threads=1):
+    """
+    Create a new archive for writing.
+
+    Args:
+        path (str): The archive, without extension; the extension of [codec] is added.
+        codec (str): Key in EXTENSIONS.
+        level (int): Compression level, None for the default of the codec.
+        threads (int): Compression threads (tar.zst only; 0: one per cpu core).
+
+    Returns:
+        The archive, with write(path, arcname), writestr(data, arcname), close() and filename.
+    """
+    if codec not in EXTENSIONS:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    path += EXTENSIONS[codec]
+
+    if codec == "zip":
+        return _ZipArchive(path, level)
+    if codec == "tar.zst":
+        return _TarZstdArchive(path, level, threads or os.cpu_count())
+
+    import py7zr
+
+    if codec == "7z-zstd":
+        filters = [{"id": py7zr.FILTER_ZSTD, "level": 3 if level is None else level}]
+    else:
+        filters = None if level is None else [{"id": py7zr.FILTER_LZMA2, "preset": level}]
+    return py7zr.SevenZipFile(path, "w", filters=filters)
+
+
+def open_new_archive(path, codec="7z", level=None, threads=1):
+    """
+    Create an archive under a name that no archive has yet, never truncating one.
+
+    The name is claimed with O_EXCL; when [path] is taken (e.g. two runs in the
+    same second) a counter is added: [path]-1, [path]-2, ...
+
+    Args:
+        path (str): The archive, without extension.
+        codec (str): Key in EXTENSIONS.
+        level (int): Compression level, None for the default of the codec.
+        threads (int): Compression threads, see open_archive.
+
+    Returns:
+        The archive, see open_archive.
+    """
+    if codec not in EXTENSIONS:
+        raise ValueError(f"Unknown archive codec: {codec}")
+
+    for counter in itertools.count():
+        candidate = f"{path}-{counter}" if counter else path
+        try:
+            os.close(os.open(candidate + EXTENSIONS[codec], os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        try:
+            # the writer replaces the empty file that holds the name
+            return open_archive(candidate, codec, level, threads)
+        except BaseException:
+            os.remove(candidate + EXTENSIONS[codec])
+            raise
+
+
+def commit_archive(path):
+    """
+    Flush a closed archive to disk, so its files can be removed safely.
+
+    Args:
+        path (str): The archive.
+
+    Returns:
+        None
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _ReaderClosed(Exception):
+    """ The reader of a 7z archive stopped before the last member. """
+
+
+def _iter_7z_members(path):
+    """
+    Yield the members of a 7z archive as they are decompressed.
+
+    py7zr pushes the members into writer objects, so the extraction runs in a
+    thread that hands each finished member over through a bounded queue.
+    """
+    import py7zr
+    from py7zr.io import Py7zIO, WriterFactory
+
+    members = queue.Queue(maxsize=MEMBER_QUEUE)
+    closed = threading.Event()
+    done = object()
+
+    def put(item):
+        while not closed.is_set():
+            try:
+                members.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _ReaderClosed(path)
+
+    class Member(Py7zIO):
+        def __init__(self, filename):
+            self.filename = filename
+            self._buffer = io.BytesIO()
+
+        def write(self, data):
+            return self._buffer.write(data)
+
+        def read(self, size=None):
+            return self._buffer.read(size)
+
+        def seek(self, offset, whence=0):
+            return self._buffer.seek(offset, whence)
+
+        def flush(self):
+            pass
+
+        def size(self):
+            return self._buffer.getbuffer().nbytes
+
+        def close(self):
+            put((self.filename, self._buffer.getvalue()))
+
+    class Factory(WriterFactory):
+        def create(self, filename):
+            return Member(filename)
+
+    def extract():
+        try:
+            with py7zr.SevenZipFile(path, "r") as archive:
+                archive.extractall(factory=Factory())
+            put(done)
+        except _ReaderClosed:
+            pass
+        except Exception as e:
+            put(e)
+
+    worker = threading.Thread(target=extract, daemon=True)
+    worker.start()
+    try:
+        while (item := members.get()) is not done:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        closed.set()
+        worker.join()
+
+
+def iter_members(path):
+    """
+    Yield the files in an archive, in archive order, without extracting to disk.
+
+    Args:
+        path (str): The archive (.7z, .zip or .tar.zst).
+
+    Yields:
+        tuple: (member name, bytes)
+    """
+    if path.endswith(".7z"):
+        yield from _iter_7z_members(path)
+    elif path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, archive.read(info)
+    elif path.endswith(".tar.zst"):
+        with _zstd().ZstdFile(path) as stream, tarfile.open(fileobj=stream, mode="r|") as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info).read()
+    else:
+        raise ValueError(f"Not a backup archive: {path}")
+
+
+def read_member(path, name):
+    """
+    Read one file from an archive without extracting the others to disk.
+
+    Args:
+        path (str): The archive.
+        name (str): The member name.
+
+    Returns:
+        bytes: The content, None if the archive has no such member.
+    """
+    if path.endswith(".7z"):
+        import py7zr
+        from py7zr.io import BytesIOFactory
+
+        factory = BytesIOFactory(limit=2 ** 31)
+        with py7zr.SevenZipFile(path, "r") as archive:
+            if name not in archive.getnames():
+                return None
+            archive.extract(targets=[name], factory=factory)
+        member = factory.get(name)
+        member.seek(0)
+        return member.read()
+
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            try:
+                return archive.read(name)
+            except KeyError:
+                return None
+
+    for member, data in iter_members(path):
+        if member == name:
+            return data
+    return None
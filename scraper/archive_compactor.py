@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compaction of the per-run backup archives into day and month archives, with an index.
+"""
+
+import os
+import re
+import csv
+import fnmatch
+import sqlite3
+import logging
+import posixpath
+from datetime import date
+from collections import defaultdict
+
+# local modules
+from scraper.data_manager import METER_FILES
+from scraper.csv_reader import parse_meter_bytes, content_hash
+from scraper.archive_backend import EXTENSIONS, open_archive, commit_archive, iter_members, read_member
+
+_EXTENSION = r"(\.7z|\.zip|\.tar\.zst)$"
+RUN_ARCHIVE = re.compile(r"^(\d{8})@\d{6}(?:-(\d+))?" + _EXTENSION) # YYYYmmdd@HHMMSS[-n], one per run
+DAY_ARCHIVE = re.compile(r"^(\d{6})\d{2}" + _EXTENSION) # YYYYmmdd
+MONTH_ARCHIVE = re.compile(r"^(\d{6})" + _EXTENSION) # YYYYmm
+TEMP_PREFIX = "." # archives being written, e.g. .20231005.tmp.7z
+
+
+class ArchiveCompactor:
+    """
+    Merges the per-run backup archives into one archive per day, and the
+    archives of past days into one archive per month.
+
+    The index (an SQLite file in the backup folder) records which archive
+    holds which file, and the meter and reading date of the meter files, so
+    a single file can be taken out of the backup without unpacking the rest.
+    """
+
+    def __init__(self, config, backupdir):
+        """
+        Initialize the ArchiveCompactor.
+
+        Args:
+            config (ConfigurationManager): The configuration.
+            backupdir (str): The directory where backup archives are stored.
+
+        Returns:
+            None
+        """
+        self.config = config
+        self.backupdir = backupdir
+        self.codec = self.config.get("archive", "codec", "7z")
+        level = self.config.get("archive", "level", "")
+        self.level = int(level) if level else None
+        self.threads = self.config.getint("archive", "threads", 0)
+        self.auto_compact = self.config.getboolean("archive", "auto_compact", False)
+        self.index_path = os.path.join(backupdir, self.config.get("archive", "index", "archive_index.db"))
+        self.timeout_seconds = 20
+        logging.info(self.__class__.__name__)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=self.timeout_seconds)
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS Archives (Archive TEXT PRIMARY KEY)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ArchivedFiles ("
+                "FileName TEXT NOT NULL, "
+                "Archive TEXT NOT NULL, "
+                "MeterName TEXT, "
+                "ReadingDate TEXT, "
+                "PRIMARY KEY (FileName, Archive))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ArchivedFileMeterDate ON ArchivedFiles (MeterName, ReadingDate)")
+        return conn
+
+    def _archives(self):
+        """
+        List the backup archives, removing the leftovers of an interrupted merge.
+
+        Returns:
+            list: Archive file names, in the order they were written.
+        """
+        def written(name):
+            # 20231005@120000-1.7z was written after 20231005@120000.7z
+            match = RUN_ARCHIVE.match(name)
+            return (name[:15], int(match.group(2) or 0), name) if match else (re.sub(_EXTENSION, "", name), 0, name)
+
+        names = []
+        for name in sorted(os.listdir(self.backupdir), key=written):
+            if name.startswith(TEMP_PREFIX) and ".tmp" in name:
+                logging.warning(f"Removing incomplete archive {name}")
+                os.remove(os.path.join(self.backupdir, name))
+            elif re.search(_EXTENSION, name) and not name.startswith(TEMP_PREFIX):
+                names.append(name)
+        return names
+
+    @staticmethod
+    def _describe(name, data):
+        """
+        Meter and reading date of an archived file.
+
+        Returns:
+            tuple: (MeterName, ReadingDate), (None, None) for other files.
+        """
+        if not fnmatch.fnmatch(posixpath.basename(name), METER_FILES):
+            return None, None
+        try:
+            reading = parse_meter_bytes(data)
+            return reading["MeterName"] or None, str(reading["MeterDate"]) or None
+        except (ValueError, csv.Error) as e:
+            logging.warning(f"Cannot read archived file {name}: {e}")
+            return None, None
+
+    def _index(self, conn, archive, entries):
+        """
+        Replace the index entries of [archive]. Runs inside the caller's transaction.
+        """
+        conn.execute("DELETE FROM ArchivedFiles WHERE Archive = ?", (archive,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO ArchivedFiles (FileName, Archive, MeterName, ReadingDate) VALUES (?, ?, ?, ?)",
+            [(name, archive, meter, reading_date) for name, meter, reading_date in entries],
+        )
+        conn.execute("INSERT OR IGNORE INTO Archives (Archive) VALUES (?)", (archive,))
+
+    def _forget(self, conn, archive):
+        conn.execute("DELETE FROM ArchivedFiles WHERE Archive = ?", (archive,))
+        conn.execute("DELETE FROM Archives WHERE Archive = ?", (archive,))
+
+    def _merge(self, conn, inputs, target):
+        """
+        Write the files of [inputs] into the archive [target] and remove the inputs.
+
+        A file that is in more than one input with the same content is stored
+        once. Meters reuse file names, so a file with the same name but other
+        content is kept under the name of its input as a prefix, e.g.
+        20231005@120000-1_A14_E01@22.csv. The inputs are removed only after
+        the merged archive is on disk and indexed.
+
+        Args:
+            conn (sqlite3.Connection): Connection to the index.
+            inputs (list): Archive file names, in order.
+            target (str): File name of the merged archive, without extension.
+
+        Returns:
+            str: The file name of the merged archive.
+        """
+        temp_path = os.path.join(self.backupdir, f"{TEMP_PREFIX}{target}.tmp")
+        entries, names, stored = [], set(), {} # stored: (member name, content hash) -> name in the archive
+        with open_archive(temp_path, self.codec, self.level, self.threads) as archive:
+            for name in inputs:
+                stem = re.sub(_EXTENSION, "", name)
+                for member, data in iter_members(os.path.join(self.backupdir, name)):
+                    key = (member, content_hash(data))
+                    if key in stored:
+                        continue # the same file, e.g. in two runs
+                    head, tail = posixpath.split(member)
+                    arcname, counter = member, 0
+                    while arcname in names:
+                        counter += 1
+                        arcname = posixpath.join(head, f"{stem}_{tail}" if counter == 1 else f"{stem}-{counter}_{tail}")
+                    names.add(arcname)
+                    stored[key] = arcname
+                    archive.writestr(data, arcname)
+                    entries.append((arcname, *self._describe(arcname, data)))
+
+        merged = target + EXTENSIONS[self.codec]
+        commit_archive(archive.filename)
+        os.replace(archive.filename, os.path.join(self.backupdir, merged))
+
+        with conn:
+            for name in inputs:
+                self._forget(conn, name)
+            self._index(conn, merged, entries)
+
+        for name in inputs:
+            if name != merged:
+                os.remove(os.path.join(self.backupdir, name))
+
+        logging.info(f"Merged {len(inputs)} archives into {merged} ({len(entries)} files)")
+        return merged
+
+    def _index_missing(self, conn):
+        """
+        Index the archives that are not in the index yet, e.g. the latest runs.
+        """
+        indexed = {archive for archive, in conn.execute("SELECT Archive FROM Archives")}
+        archives = self._archives()
+        for name in archives:
+            if name not in indexed:
+                try:
+                    entries = [
+                        (member, *self._describe(member, data))
+                        for member, data in iter_members(os.path.join(self.backupdir, name))
+                    ]
+                except Exception as e:
+                    # e.g. the archive of a run that is still writing it; indexed next time
+                    logging.warning(f"Cannot index archive {name}: {e}")
+                    continue
+                with conn:
+                    self._index(conn, name, entries)
+        # archives removed by hand
+        with conn:
+            for name in indexed - set(archives):
+                self._forget(conn, name)
+
+    def compact(self, today=None):
+        """
+        Merge the run archives of past days into day archives and the day
+        archives of past months into month archives, then bring the index up to date.
+
+        Archives of today and of the current month are left alone, they are still growing.
+
+        Args:
+            today (date): The current day, for testing.
+
+        Returns:
+            list: The file names of the merged archives.
+        """
+        today = (today or date.today()).strftime("%Y%m%d")
+        merged = []
+
+        if not os.path.exists(self.backupdir):
+            return merged
+
+        conn = self._connect()
+        try:
+            # Step 1: run archives -> day archives, joining an existing day archive
+            days = defaultdict(list)
+            for name in self._archives():
+                if (DAY_ARCHIVE.match(name) or RUN_ARCHIVE.match(name)) and name[:8] < today:
+                    days[name[:8]].append(name)
+            for day, inputs in sorted(days.items()):
+                if any(RUN_ARCHIVE.match(name) for name in inputs):
+                    merged.append(self._merge(conn, inputs, day))
+
+            # Step 2: day archives -> month archives, joining an existing month archive
+            months = defaultdict(list)
+            for name in self._archives():
+                if (match := MONTH_ARCHIVE.match(name)) or (match := DAY_ARCHIVE.match(name)):
+                    month = match.group(1)
+                    if month < today[:6]:
+                        months[month].append(name)
+            for month, inputs in sorted(months.items()):
+                if any(DAY_ARCHIVE.match(name) for name in inputs):
+                    merged.append(self._merge(conn, inputs, month))
+
+            # Step 3: index what was not merged
+            self._index_missing(conn)
+            return merged
+        finally:
+            conn.close()
+
+    def find(self, file_names=None, meter=None, day=None):
+        """
+        Look up archived files in the index.
+
+        Args:
+            file_names (list): Optional file names.
+            meter (str): Optional meter name.
+            day (str): Optional reading date or its start, e.g. 2023-09 or 2023-09-10.
+
+        Returns:
+            list: (FileName, Archive) pairs.
+        """
+        conn = self._connect()
+        try:
+            self._index_missing(conn)
+
+            conditions, params = [], []
+            if file_names:
+                conditions.append(f"FileName IN ({', '.join('?' * len(file_names))})")
+                params += file_names
+            if meter:
+                conditions.append("MeterName = ?")
+                params.append(meter)
+            if day:
+                conditions.append("ReadingDate LIKE ? || '%'")
+                params.append(day)
+
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            return conn.execute(
+                f"SELECT FileName, Archive FROM ArchivedFiles {where} ORDER BY MeterName, ReadingDate, FileName",
+                params,
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def extract(self, entries, outdir):
+        """
+        Write archived files to a directory, reading only their own archives.
+
+        Args:
+            entries (list): (FileName, Archive) pairs, see find.
+            outdir (str): The directory for the extracted files.
+
+        Returns:
+            list: The paths of the extracted files.
+        """
+        os.makedirs(outdir, exist_ok=True)
+        wanted = defaultdict(set)
+        for file_name, archive in entries:
+            wanted[archive].add(file_name)
+
+        paths = []
+        for archive, file_names in wanted.items():
+            archive_path = os.path.join(self.backupdir, archive)
+            if len(file_names) == 1:
+                file_name = next(iter(file_names))
+                members = [(file_name, read_member(archive_path, file_name))]
+            else:
+                members = (
+                    (member, data)
+                    for member, data in iter_members(archive_path)
+                    if member in file_names
+                )
+
+            for file_name, data in members:
+                if data is None:
+                    logging.error(f"{file_name} not found in {archive}")
+                    continue
+                path = os.path.join(outdir, posixpath.basename(file_name))
+                with open(path, "wb") as out_file:
+                    out_file.write(data)
+                paths.append(path)
+        return paths
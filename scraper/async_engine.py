@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio run engine that overlaps the stages of a scraper run.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+
+# local modules
+from scraper.vpn_manager import VPNManager
+from scraper.ftp_manager import FTPManager
+from scraper.email_manager import EmailManager
+from scraper.data_manager import DataManager
+from scraper.archive_compactor import ArchiveCompactor
+
+_DONE = object() # marks the end of a queue
+
+
+class AsyncEngine:
+    """
+    Runs one scraper run as asyncio stages linked by a bounded queue.
+
+        local backlog --+
+        vpn ------------+-- ftp download --queue-- parse + database --+-- archive / delete remote --+-- compact
+                                                                      +-- email --------------------+
+
+    The download folder backlog is ingested while the VPN comes up. Files are
+    parsed and saved while the download is still running, and archiving runs
+    alongside sending the email. The managers are blocking (subprocess,
+    ftplib, sqlite3, py7zr, smtplib), so every stage runs them in a worker
+    thread; the queue holds at most queue_size files between download and
+    database.
+    """
+
+    def __init__(self, config, base_dir, data_dir, backup_dir):
+        """
+        Initialize the AsyncEngine.
+
+        Args:
+            config (ConfigurationManager): The configuration.
+            base_dir (str): The base directory of the database and result file.
+            data_dir (str): The download folder.
+            backup_dir (str): The directory where backup archives will be stored.
+
+        Returns:
+            None
+        """
+        self.config = config
+        self.base_dir = base_dir
+        self.data_dir = data_dir
+        self.backup_dir = backup_dir
+        self.queue_size = self.config.getint("performance", "queue_size", 64)
+        logging.info(self.__class__.__name__)
+
+    async def _ingest_backlog(self, data_manager):
+        """
+        Empty (process+archive) the download folder before a new batch is saved.
+        """
+        if await asyncio.to_thread(data_manager.local_has_csv, self.data_dir):
+            await asyncio.to_thread(data_manager.stream_csv_files_to_db, self.data_dir, self.base_dir, self.base_dir)
+            await asyncio.to_thread(data_manager.archive_files, self.data_dir, self.backup_dir, self.base_dir)
+
+    async def _produce(self, source, queue, stop):
+        """
+        Put the items of the blocking iterator source() on [queue], followed by _DONE.
+
+        Stops early when [stop] is set, i.e. when the consumer has failed.
+        """
+        loop = asyncio.get_running_loop()
+
+        def pump():
+            try:
+                for item in source():
+                    if stop.is_set():
+                        break
+                    asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+            finally:
+                asyncio.run_coroutine_threadsafe(queue.put(_DONE), loop).result()
+
+        await asyncio.to_thread(pump)
+
+    async def _consume(self, sink, queue, stop, ready=None):
+        """
+        Run the blocking sink(iterable) over the items on [queue] until _DONE,
+        after the awaitable [ready] is done.
+
+        Returns:
+            The result of sink.
+        """
+        loop = asyncio.get_running_loop()
+        finished = threading.Event()
+
+        def items():
+            while (item := asyncio.run_coroutine_threadsafe(queue.get(), loop).result()) is not _DONE:
+                yield item
+            finished.set()
+
+        try:
+            if ready is not None:
+                await ready
+            return await asyncio.to_thread(sink, items())
+        except BaseException:
+            # unblock the producer: it stops at the next item, drop what is queued
+            stop.set()
+            while not finished.is_set() and await queue.get() is not _DONE:
+                pass
+            raise
+
+    def _send_email(self):
+        email_manager = EmailManager(self.config)
+        attachme = os.path.join(
+            self.base_dir,
+            self.config.get("folders", "csv_result")
+        ).split()
+        email_manager.send_email(attachme)
+
+    async def run(self):
+        """
+        Connect, download, save, archive and report one batch of meter files.
+
+        Returns:
+            None
+        """
+        data_manager = DataManager(self.config)
+        vpn_manager = VPNManager(self.config, self.base_dir)
+        backlog = asyncio.create_task(self._ingest_backlog(data_manager))
+
+        try:
+            if not await asyncio.to_thread(vpn_manager.connect):
+                logging.error(f'Cannot connect to vpn ({vpn_manager.vpn_name})')
+                await backlog
+                return
+
+            ftp_manager = FTPManager(self.config)
+            if not await asyncio.to_thread(ftp_manager.connect):
+                await backlog
+                return
+
+            # files the manifest already holds are not transferred again
+            known_files = lambda names: data_manager.ingested_files(self.base_dir, names)
+
+            if ftp_manager.transfer_mode == "memory":
+                # parse, store and archive straight from the download buffers
+                source = lambda: ftp_manager.fetch_files(known_files)
+                sink = lambda files: data_manager.ingest_buffers(files, self.base_dir, self.base_dir, self.backup_dir)
+            else:
+                # the backlog archives the download folder, it must be empty before new files arrive
+                await backlog
+                source = lambda: ftp_manager.iter_download_files(self.data_dir, known_files)
+                sink = lambda paths: data_manager.ingest_paths(paths, self.base_dir, self.base_dir)
+
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            stop = threading.Event()
+            producer = asyncio.create_task(self._produce(source, queue, stop))
+            try:
+                # the database is written by one stage at a time
+                downloaded = await self._consume(sink, queue, stop, ready=backlog)
+            finally:
+                await producer
+
+            finishing = []
+            if ftp_manager.transfer_mode == "memory":
+                finishing.append(asyncio.to_thread(ftp_manager.delete_remote_files, downloaded))
+            elif downloaded:
+                finishing.append(asyncio.to_thread(data_manager.archive_files, self.data_dir, self.backup_dir, self.base_dir))
+
+            if downloaded:
+                finishing.append(asyncio.to_thread(self._send_email))
+            else:
+                logging.warning("No CSV files on server.")
+
+            await asyncio.gather(*finishing)
+
+            # merge the run archives of past days, once the new archive is complete
+            compactor = ArchiveCompactor(self.config, self.backup_dir)
+            if compactor.auto_compact:
+                await asyncio.to_thread(compactor.compact)
+        finally:
+            # a failed stage must not leave the backlog running in its thread
+            await asyncio.gather(backlog, return_exceptions=True)
+            await asyncio.to_thread(vpn_manager.disconnect)
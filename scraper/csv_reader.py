@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reader of the Socomec meter files.
+"""
+
+import io
+import csv
+import hashlib
+from itertools import islice
+
+# Positions of the cells in a Socomec meter file (blank lines not counted)
+METER_ROW = 1  # MeterName in column 0, date in column 4
+VALUE_ROW = 8  # date in column 0, value in column 1
+NAME_COL, HEADER_DATE_COL = 0, 4
+DATE_COL, VALUE_COL = 0, 1
+
+
+def make_reading(metername, meterdate, metervalue):
+    """
+    Build a reading as used by DataManager.
+
+    Args:
+        metername (str): Name of the meter, the address is the part before '_'.
+        meterdate (str): Date of the reading.
+        metervalue (str): Value of the reading.
+
+    Returns:
+        dict: The reading.
+    """
+    return {
+        "MeterName": metername,
+        "AddressName": str(metername).split("_")[0],
+        "MeterValue": metervalue,
+        "MeterDate": meterdate,
+    }
+
+
+def _cell(row, col):
+    return row[col] if col < len(row) else ""
+
+
+def parse_meter_lines(lines):
+    """
+    Extract the reading from the lines of a Socomec meter file.
+
+    Stops reading as soon as the value row has been seen.
+
+    Args:
+        lines (iterable): Lines of the file, e.g. an open text file.
+
+    Returns:
+        dict: The reading.
+    """
+    rows = islice((row for row in csv.reader(lines) if row), VALUE_ROW + 1)
+
+    metername, meterdate, metervalue = "", "", 0
+    for index, row in enumerate(rows):
+        if index == METER_ROW:
+            metername = _cell(row, NAME_COL)
+            meterdate = _cell(row, HEADER_DATE_COL)
+        elif index == VALUE_ROW:
+            meterdate = _cell(row, DATE_COL)
+            metervalue = _cell(row, VALUE_COL)
+
+    return make_reading(metername, meterdate, metervalue)
+
+
+def read_meter_file(path):
+    """
+    Read the reading from a Socomec meter file on disk.
+
+    Args:
+        path (str): The csv-file.
+
+    Returns:
+        dict: The reading.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as csv_file:
+        return parse_meter_lines(csv_file)
+
+
+def parse_meter_bytes(data):
+    """
+    Read the reading from the content of a Socomec meter file.
+
+    Args:
+        data (bytes): Content of the csv-file.
+
+    Returns:
+        dict: The reading.
+    """
+    return parse_meter_lines(io.StringIO(data.decode("utf-8"), newline=""))
+
+
+def read_meter_file_pandas(path):
+    """
+    Read the reading from a Socomec meter file with pandas.
+
+    Args:
+        path (str): The csv-file, or an open binary file.
+
+    Returns:
+        dict: The reading.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path, header=None, usecols=[0, 1, 4])
+
+    if len(df) > METER_ROW:
+        metername = df.iloc[METER_ROW, 0]
+        meterdate = df.iloc[METER_ROW, 2]
+    else:
+        metername, meterdate = "", ""
+
+    if len(df) > VALUE_ROW:
+        meterdate = df.iloc[VALUE_ROW, 0]
+        metervalue = df.iloc[VALUE_ROW, 1]
+    else:
+        metervalue = 0
+
+    return make_reading(metername, meterdate, metervalue)
+
+
+# csv_engine setting -> reader
+READERS = {
+    "native": read_meter_file,
+    "pandas": read_meter_file_pandas,
+}
+
+
+def content_hash(data):
+    """
+    Hash of the content of a meter file, as stored in the IngestedFiles manifest.
+
+    Args:
+        data (bytes): Content of the csv-file.
+
+    Returns:
+        str: sha256 hex digest.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_meter_file_hashed(path, engine="native"):
+    """
+    Read the reading and the content hash of a meter file, reading the file once.
+
+    Args:
+        path (str): The csv-file.
+        engine (str): Key in READERS.
+
+    Returns:
+        tuple: (reading, sha256 hex digest of the content)
+    """
+    with open(path, "rb") as csv_file:
+        data = csv_file.read()
+
+    if engine == "native":
+        reading = parse_meter_bytes(data)
+    else:
+        reading = READERS[engine](io.BytesIO(data))
+    return reading, content_hash(data)
+
+
+def read_meter_files(paths, engine="native", hashed=False):
+    """
+    Read a chunk of meter files, used as the unit of work for parallel parsing.
+
+    Args:
+        paths (list): The csv-files.
+        engine (str): Key in READERS.
+        hashed (bool): Return (reading, content hash) pairs instead of readings.
+
+    Returns:
+        list: The readings, in the order of [paths].
+    """
+    if hashed:
+        return [read_meter_file_hashed(path, engine) for path in paths]
+
+    read_meter_file = READERS[engine]
+    return [read_meter_file(path) for path in paths]
+
+
+def parse_meter_buffers(members):
+    """
+    Read a chunk of meter files from memory, used as the unit of work for parallel parsing.
+
+    Args:
+        members (list): (name, bytes) per meter file.
+
+    Returns:
+        list: (name, size, reading, sha256 hex digest) per file, in the order of [members].
+    """
+    return [(name, len(data), parse_meter_bytes(data), content_hash(data)) for name, data in members]
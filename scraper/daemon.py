@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resident scraper that polls the FTP server on an interval.
+"""
+
+import os
+import time
+import signal
+import logging
+import threading
+
+# local modules
+from scraper.vpn_manager import VPNManager
+from scraper.ftp_manager import FTPManager
+from scraper.email_manager import EmailManager
+from scraper.data_manager import DataManager
+from scraper.archive_compactor import ArchiveCompactor
+
+
+class ScraperDaemon:
+    """
+    Stays resident and collects the meter files every poll_seconds.
+
+    The VPN tunnel and the FTP sessions (the main one and the pool of
+    ftp_connections) stay open between polls; they get a NOOP every
+    keepalive_seconds and are only set up again when that fails. The
+    results of every batch are added to the csv result file, which is
+    mailed at most every mail_seconds, once new files have come in, and
+    started afresh after a successful send.
+    """
+
+    def __init__(self, config, base_dir, data_dir, backup_dir):
+        """
+        Initialize the ScraperDaemon.
+
+        Args:
+            config (ConfigurationManager): The configuration.
+            base_dir (str): The base directory of the database and result file.
+            data_dir (str): The download folder.
+            backup_dir (str): The directory where backup archives will be stored.
+
+        Returns:
+            None
+        """
+        self.config = config
+        self.base_dir = base_dir
+        self.data_dir = data_dir
+        self.backup_dir = backup_dir
+        self.poll_seconds = self.config.getint("daemon", "poll_seconds", 300)
+        self.keepalive_seconds = self.config.getint("daemon", "keepalive_seconds", 60)
+        self.mail_seconds = self.config.getint("daemon", "mail_seconds", 3600)
+
+        self.data_manager = DataManager(self.config)
+        self.data_manager.append_results = True # one mail covers all batches since the last one
+        self.compactor = ArchiveCompactor(self.config, self.backup_dir)
+        self.vpn_manager = VPNManager(self.config, self.base_dir)
+        self.ftp_manager = None # connected on the first poll
+        self.mail_pending = False
+        self.last_mail = None
+        self.stopping = threading.Event()
+        logging.info(self.__class__.__name__)
+
+    def stop(self, *args):
+        """
+        Let the daemon finish the current poll and exit, e.g. on SIGTERM.
+
+        Returns:
+            None
+        """
+        logging.info("Stopping daemon")
+        self.stopping.set()
+
+    def _ensure_connected(self):
+        """
+        Check the tunnel and the FTP session, setting them up again where needed.
+
+        Returns:
+            bool: True if the FTP session is usable, False otherwise.
+        """
+        if self.ftp_manager is not None and self.ftp_manager.keep_alive():
+            return True
+
+        if not self.vpn_manager.connect():
+            logging.error(f'Cannot connect to vpn ({self.vpn_manager.vpn_name})')
+            return False
+
+        if self.ftp_manager is None:
+            self.ftp_manager = FTPManager(self.config)
+            self.ftp_manager.keep_sessions = True
+            connected = self.ftp_manager.connect()
+        else:
+            connected = self.ftp_manager.reconnect()
+
+        if not connected:
+            # the tunnel may be up without routing; bring it up again next time
+            self.vpn_manager.disconnect()
+        return connected
+
+    def _send_mail_when_due(self):
+        if not self.mail_pending:
+            return
+        if self.last_mail is not None and time.monotonic() - self.last_mail < self.mail_seconds:
+            return
+
+        email_manager = EmailManager(self.config)
+        result_path = os.path.join(
+            self.base_dir,
+            self.config.get("folders", "csv_result")
+        )
+        if not email_manager.send_email(result_path.split()):
+            return # the results keep adding up, retried after the next poll
+
+        # the next mail starts with the next batch
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        self.mail_pending = False
+        self.last_mail = time.monotonic()
+
+    def poll(self):
+        """
+        Collect one batch: the same steps as a single run, on the open connections.
+
+        Returns:
+            list: The files that were transferred.
+        """
+        data_manager = self.data_manager
+
+        # empty (process+archive) the download folder before downloading a new batch
+        if data_manager.local_has_csv(self.data_dir):
+            data_manager.stream_csv_files_to_db(self.data_dir, self.base_dir, self.base_dir)
+            data_manager.archive_files(self.data_dir, self.backup_dir, self.base_dir)
+
+        if not self._ensure_connected():
+            return []
+
+        ftp_manager = self.ftp_manager
+        # files the manifest already holds are not transferred again
+        known_files = lambda names: data_manager.ingested_files(self.base_dir, names)
+
+        if ftp_manager.transfer_mode == "memory":
+            # parse, store and archive straight from the download buffers
+            downloaded = data_manager.ingest_buffers(ftp_manager.fetch_files(known_files), self.base_dir, self.base_dir, self.backup_dir)
+            ftp_manager.delete_remote_files(downloaded)
+        else:
+            downloaded = ftp_manager.download_files(self.data_dir, known_files)
+            if downloaded:
+                data_manager.stream_csv_files_to_db(self.data_dir, self.base_dir, self.base_dir)
+                data_manager.archive_files(self.data_dir, self.backup_dir, self.base_dir)
+
+        if downloaded:
+            logging.info(f"{len(downloaded)} new files")
+            self.mail_pending = True
+        return downloaded
+
+    def _idle(self):
+        """
+        Wait for the next poll, keeping the FTP session alive meanwhile.
+        """
+        deadline = time.monotonic() + self.poll_seconds
+        while not self.stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self.stopping.wait(min(self.keepalive_seconds, remaining)):
+                return
+            if self.ftp_manager is not None and time.monotonic() < deadline:
+                # a lost session is set up again by the next poll
+                self.ftp_manager.keep_alive()
+
+    def run(self):
+        """
+        Poll until stopped by SIGTERM or SIGINT.
+
+        Returns:
+            None
+        """
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+
+        logging.info(f"Daemon polling every {self.poll_seconds}s")
+        try:
+            while not self.stopping.is_set():
+                try:
+                    self.poll()
+                    self._send_mail_when_due()
+                    if self.compactor.auto_compact:
+                        self.compactor.compact()
+                except Exception as e:
+                    logging.error(f"An error occurred: {e}")
+                self._idle()
+        finally:
+            if self.ftp_manager is not None:
+                self.ftp_manager.close()
+            self.vpn_manager.disconnect()
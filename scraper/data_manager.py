@@ -7,12 +7,17 @@ Created on Tue Sep 26 17:04:00 2023
 """
 
 import os
+import csv
 import glob
-import pandas as pd
+import time
+import fnmatch
 import sqlite3
+import posixpath
 import logging
 from datetime import datetime
-from py7zr import SevenZipFile
+from collections import deque
+from itertools import islice
+import concurrent.futures
 
 # add workspace-path to the %PATH% env
 import sys
@@ -21,6 +26,23 @@ sys.path.append(".")
 # local modules
 from core.configuration_manager import ConfigurationManager
 from core.utils import canonical_path
+from core.migration_manager import READING_INDEXES, CONSUMPTION_DIRTY, refresh_daily_consumption
+from core.database import connect, database_pragmas
+from scraper.dimension_cache import DimensionCache
+from scraper.ftp_manager import PARTIAL_SUFFIX
+from scraper.archive_backend import open_new_archive, commit_archive, iter_members
+from scraper.csv_reader import read_meter_files, read_meter_file_hashed, parse_meter_bytes, parse_meter_buffers, content_hash
+
+METER_FILES = "?*@*.csv" # skip files without '@' in filename
+RESULT_COLUMNS = ["MeterName", "AddressName", "MeterValue", "MeterDate"]
+MANIFEST_BATCH = 500 # file names per manifest lookup
+BACKFILL_CACHE_KIB = 262144 # page cache of the backfill connection (256 MB)
+# parse_executor -> executor class in concurrent.futures, looked up when a pool is used
+# (importing ProcessPoolExecutor loads multiprocessing)
+EXECUTORS = {
+    "process": "ProcessPoolExecutor",
+    "thread": "ThreadPoolExecutor",
+}
 
 
 class DataManager:
@@ -37,6 +59,23 @@ class DataManager:
         self.config = config
         self.csv_result = self.config.get("folders", "csv_result")
         self.db_name = self.config.get("folders", "db_name")
+        self.csv_engine = self.config.get("performance", "csv_engine", "native")
+        self.parse_workers = self.config.getint("performance", "parse_workers", 1) or os.cpu_count()
+        self.parse_executor = self.config.get("performance", "parse_executor", "process")
+        self.parse_chunk_size = self.config.getint("performance", "parse_chunk_size", 500)
+        self.db_chunk_size = self.config.getint("performance", "db_chunk_size", 1000)
+        # files arriving from a download are committed in small chunks, see ingest_paths
+        self.stream_chunk_files = self.config.getint("performance", "stream_chunk_files", 50)
+        self.stream_chunk_seconds = float(self.config.get("performance", "stream_chunk_seconds", 2))
+        self.bulk_ingest = self.config.getboolean("performance", "bulk_ingest", True)
+        self.dimension_snapshot = self.config.get("performance", "dimension_snapshot", "")
+        self.dimension_cache = DimensionCache()
+        self.append_results = False # add to the csv result file instead of replacing it, see ScraperDaemon
+        self.archive_codec = self.config.get("archive", "codec", "7z")
+        archive_level = self.config.get("archive", "level", "")
+        self.archive_level = int(archive_level) if archive_level else None
+        self.archive_threads = self.config.getint("archive", "threads", 0)
+        self.pragmas = database_pragmas(self.config)
         self.timeout_seconds = 20
         logging.info(self.__class__.__name__)
 
@@ -75,46 +114,15 @@ class DataManager:
         # datadir = canonical_path(datadir)
         # resultdir = canonical_path(resultdir)
         
-        result_list = []
-
         try:
             # Iterate through CSV files in the specified directory
-            for path in glob.iglob(os.path.join(datadir, "?*@*.csv")): # skip files without '@' in filename
-                df = pd.read_csv(path, header=None, usecols=[0, 1, 4])
-
-                if len(df) > 1:
-                    metername = df.iloc[1, 0]
-                    meterdate = df.iloc[1, 2]
-                else:
-                    metername, meterdate = "", ""
-
-                if len(df) > 8:
-                    meterdate = df.iloc[8, 0]
-                    metervalue = df.iloc[8, 1]
-                else:
-                    metervalue = 0
-
-                addressname = str(metername).split("_")[0]
-
-                result_list.append(
-                    {
-                        "MeterName": metername,
-                        "AddressName": addressname,
-                        "MeterValue": metervalue,
-                        "MeterDate": meterdate,
-                    }
-                )
+            result_list = self.iter_readings(datadir)
 
             # Sort the result list by MeterName
             result_list = sorted(result_list, key=lambda k: k["MeterName"])
 
-            # Create a DataFrame from the result list
-            df_result = pd.DataFrame(
-                result_list, columns=["MeterName", "AddressName", "MeterValue", "MeterDate"]
-            )
-
-            # Save the DataFrame as a CSV file
-            df_result.to_csv(os.path.join(resultdir, self.csv_result), index=False)
+            # Save the result list as a CSV file
+            self.write_result_csv(result_list, resultdir)
             logging.info("CSV files read successfully.")
 
             return result_list
@@ -123,6 +131,206 @@ class DataManager:
             logging.error(f"An error occurred while reading CSV files: {e}")
             raise
 
+    def _meter_paths(self, datadir):
+        return sorted(glob.iglob(os.path.join(datadir, METER_FILES)))
+
+    def iter_readings(self, datadir):
+        """
+        Parse the meter files in a directory one by one, in file name order.
+
+        Args:
+            datadir (str): The directory containing CSV files to be processed.
+
+        Yields:
+            dict: A reading.
+        """
+        yield from self._iter_parsed(self._meter_paths(datadir))
+
+    def _iter_parsed(self, paths, hashed=False):
+        """
+        Parse meter files one by one, in the order of [paths].
+
+        Files are parsed in chunks over a worker pool when parse_workers > 1;
+        at most two chunks per worker are in flight, so memory stays bounded.
+
+        Args:
+            paths (list): The csv-files.
+            hashed (bool): Yield (reading, content hash) pairs instead of readings.
+
+        Yields:
+            dict: A reading.
+        """
+        if self.parse_workers <= 1 or len(paths) <= self.parse_chunk_size:
+            yield from read_meter_files(paths, self.csv_engine, hashed)
+            return
+
+        chunks = (
+            paths[start:start + self.parse_chunk_size]
+            for start in range(0, len(paths), self.parse_chunk_size)
+        )
+        logging.info(f"Parsing {len(paths)} files with {self.parse_workers} {self.parse_executor} workers")
+
+        executor_class = getattr(concurrent.futures, EXECUTORS[self.parse_executor])
+        with executor_class(max_workers=self.parse_workers) as executor:
+            # results are taken in submission order, so they do not depend on scheduling
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(read_meter_files, chunk, self.csv_engine, hashed))
+                if len(pending) >= 2 * self.parse_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def _iter_parsed_members(self, members):
+        """
+        Parse meter files from memory one by one, in the order of [members].
+
+        Like _iter_parsed, chunks go to a worker pool when parse_workers > 1,
+        with at most two chunks per worker in flight.
+
+        Args:
+            members (iterator): (name, bytes) per meter file.
+
+        Yields:
+            tuple: (name, size, reading, content hash)
+        """
+        chunks = iter(lambda: list(islice(members, self.parse_chunk_size)), [])
+        if self.parse_workers <= 1:
+            for chunk in chunks:
+                yield from parse_meter_buffers(chunk)
+            return
+
+        executor_class = getattr(concurrent.futures, EXECUTORS[self.parse_executor])
+        with executor_class(max_workers=self.parse_workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(parse_meter_buffers, chunk))
+                if len(pending) >= 2 * self.parse_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def _load_manifest(self, cursor, names):
+        """
+        Look up files in the IngestedFiles manifest.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor on the database.
+            names (list): File names.
+
+        Returns:
+            dict: FileName -> (FileSize, FileMTime, ContentHash) for the known files.
+        """
+        manifest = {}
+        for start in range(0, len(names), MANIFEST_BATCH):
+            batch = names[start:start + MANIFEST_BATCH]
+            cursor.execute(
+                "SELECT FileName, FileSize, FileMTime, ContentHash FROM IngestedFiles "
+                f"WHERE FileName IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            manifest.update((name, (size, mtime, digest)) for name, size, mtime, digest in cursor.fetchall())
+        return manifest
+
+    def ingested_files(self, basedir, names):
+        """
+        Look up which files the manifest has recorded as ingested.
+
+        Args:
+            basedir (str): The base directory where the database file will be located.
+            names (list): File names.
+
+        Returns:
+            dict: FileName -> (FileSize, FileMTime, ContentHash) for the files in the manifest.
+        """
+        db_path = canonical_path(os.path.join(basedir, self.db_name))
+        conn = connect(db_path, self.pragmas, self.timeout_seconds)
+        try:
+            return self._load_manifest(conn.cursor(), names)
+        finally:
+            conn.close()
+
+    def _split_by_manifest(self, cursor, paths):
+        """
+        Split meter files into files the manifest confirms as ingested and new or changed files.
+
+        A file is confirmed when name, size and modification time match the manifest.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor on the database.
+            paths (list): The csv-files.
+
+        Returns:
+            tuple: (confirmed paths, [(path, size, mtime)] to ingest, manifest)
+        """
+        manifest = self._load_manifest(cursor, [os.path.basename(path) for path in paths])
+        confirmed, pending = [], []
+        for path in paths:
+            stat = os.stat(path)
+            entry = manifest.get(os.path.basename(path))
+            if entry and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                confirmed.append(path)
+            else:
+                pending.append((path, stat.st_size, stat.st_mtime_ns))
+        return confirmed, pending, manifest
+
+    def write_result_csv(self, result_list, resultdir):
+        """
+        Save readings to the csv result file.
+
+        Args:
+            result_list (iterable): Dictionaries representing processed data.
+            resultdir (str): The directory where result file will be saved.
+
+        Returns:
+            None
+        """
+        result_file, writer = self._open_result_csv(resultdir)
+        with result_file:
+            writer.writerows(result_list)
+
+    def _snapshot_path(self, basedir):
+        if not self.dimension_snapshot:
+            return None
+        return canonical_path(os.path.join(basedir, self.dimension_snapshot))
+
+    def _save(self, cursor, result_list):
+        if self.bulk_ingest:
+            self._bulk_save(cursor, result_list)
+        else:
+            self._row_save(cursor, result_list)
+        self._update_consumption(cursor, result_list)
+        if result_list:
+            # committed together with the readings; the webapp drops its cached responses
+            cursor.execute("UPDATE DataVersion SET Version = Version + 1")
+
+    def _update_consumption(self, cursor, result_list):
+        """
+        Bring DailyConsumption up to date for the meters and days of the saved readings.
+
+        Only the days from the earliest new reading of a meter on are computed
+        again; usually that is just the latest day.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor of an open transaction.
+            result_list (list): The readings just saved.
+
+        Returns:
+            None
+        """
+        meter_ids = self.dimension_cache.meter_ids
+        dirty = {}
+        for reading in result_list:
+            meter_id, day = meter_ids[reading["MeterName"]], str(reading["MeterDate"])[:10]
+            if day < dirty.get(meter_id, "~"):
+                dirty[meter_id] = day
+        if not dirty:
+            return
+
+        cursor.execute(CONSUMPTION_DIRTY)
+        cursor.executemany("INSERT OR REPLACE INTO temp.ConsumptionDirty (MeterID, FromDay) VALUES (?, ?)", dirty.items())
+        refresh_daily_consumption(cursor)
+
     def process_and_save_to_db(self, result_list, basedir):
         """
         Process data and save it to a SQLite database.
@@ -136,47 +344,30 @@ class DataManager:
         """
 
         db_path = canonical_path(os.path.join(basedir, self.db_name))
+        snapshot_path = self._snapshot_path(basedir)
 
         try:
-            with sqlite3.connect(db_path, timeout=self.timeout_seconds) as conn:
-                cursor = conn.cursor()
-                data_to_insert = []
-
-                # Iterate through the result list and prepare data for insertion
-                for reading in result_list:
-                    MeterName = reading["MeterName"]
-                    ReadingValue = reading["MeterValue"]
-                    ReadingDate = reading["MeterDate"]
-                    AddressText = reading["AddressName"]
-
-                    # Step 1: Insert AddressText into the Addresses table (if it doesn't exist)
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO Addresses (AddressText) VALUES (?)",
-                        (AddressText,),
-                    )
-
-                    # Step 2: Insert MeterName into the Meters table (if it doesn't exist)
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO Meters (MeterName, AddressID) SELECT ?, AddressID FROM Addresses WHERE AddressText = ?",
-                        (MeterName, AddressText),
-                    )
-
-                    # Step 3: Prepare data for batch insertion into the Readings table
-                    cursor.execute(
-                        "SELECT Meters.MeterID FROM Meters WHERE Meters.MeterName = ?",
-                        (MeterName,),
-                    )
-                    meter_id = cursor.fetchone()[0]
-                    data_to_insert.append((meter_id, ReadingValue, ReadingDate))
-
-                # Step 4: Batch insertion into the Readings table
-                cursor.executemany(
-                    "INSERT OR IGNORE INTO Readings (MeterID, ReadingValue, ReadingDate) VALUES (?, ?, ?)",
-                    data_to_insert,
-                )
+            conn = connect(db_path, self.pragmas, self.timeout_seconds)
+            try:
+                # the with block commits or rolls back, it does not close the connection
+                try:
+                    with conn:
+                        cursor = conn.cursor()
+                        self.dimension_cache.warm_up(cursor, snapshot_path)
+                        self._save(cursor, result_list)
+                except BaseException:
+                    self.dimension_cache.clear()
+                    raise
+
+                if snapshot_path:
+                    self.dimension_cache.save_snapshot(conn.cursor(), snapshot_path)
+            finally:
+                conn.close()
 
             logging.info(f"{len(result_list)} readings inserted successfully.")
         except sqlite3.Error as e:
+            # IDs cached during a rolled back transaction are not valid
+            self.dimension_cache.clear()
             # Handle database errors and log errors
             logging.error(f"An error occurred while saving data to the database: {e}")
             raise
@@ -185,16 +376,563 @@ class DataManager:
             logging.error(f"IO Error: {e}")
             raise
 
-    def archive_files(self, datadir, backupdir):
+    def _open_result_csv(self, resultdir):
+        result_path = os.path.join(resultdir, self.csv_result)
+        append = self.append_results and os.path.exists(result_path) and os.path.getsize(result_path) > 0
+        result_file = open(result_path, "a" if append else "w", encoding="utf-8", newline="")
+        writer = csv.DictWriter(result_file, fieldnames=RESULT_COLUMNS, lineterminator=os.linesep)
+        if not append:
+            writer.writeheader()
+        return result_file, writer
+
+    @staticmethod
+    def _take_chunk(items, size, max_seconds=0):
+        """
+        Take the next chunk of at most [size] items from an iterator.
+
+        With max_seconds the chunk also ends at the first item that arrives
+        max_seconds after the first one of the chunk.
+
+        Args:
+            items (iterator): The items.
+            size (int): Maximum number of items.
+            max_seconds (float): Maximum time to gather a chunk, 0 for no limit.
+
+        Returns:
+            list: The chunk, empty when [items] is exhausted.
+        """
+        if not max_seconds:
+            return list(islice(items, size))
+        chunk, deadline = [], None
+        for item in items:
+            chunk.append(item)
+            deadline = deadline or time.monotonic() + max_seconds
+            if len(chunk) >= size or time.monotonic() >= deadline:
+                break
+        return chunk
+
+    def _ingest_chunks(self, conn, cursor, parsed, writer, streaming=False):
+        """
+        Save parsed meter files to the database and the result file, db_chunk_size files at a time.
+
+        Every chunk is one transaction holding the readings and their manifest
+        entries. A file whose content hash is already in the manifest (touched or
+        downloaded again) is recorded but its reading is not saved again.
+
+        Files that are still arriving from a download ([streaming]) are committed
+        every stream_chunk_files files or stream_chunk_seconds, so they are
+        stored while the download goes on.
+
+        Args:
+            conn (sqlite3.Connection): The database connection.
+            cursor (sqlite3.Cursor): Cursor on the connection.
+            parsed (iterable): (name, size, mtime, reading, digest, data) per file;
+                reading None for files that are not meter files.
+            writer (csv.DictWriter): Writer on the result file.
+            streaming (bool): [parsed] yields the files as they are downloaded.
+
+        Yields:
+            tuple: (chunk, number of readings saved), once the chunk is committed.
+        """
+        parsed = iter(parsed)
+        if streaming:
+            size, max_seconds = self.stream_chunk_files, self.stream_chunk_seconds
+        else:
+            size, max_seconds = self.db_chunk_size, 0
+
+        while chunk := self._take_chunk(parsed, size, max_seconds):
+            ingested_at = datetime.now().isoformat(timespec="seconds")
+            meter_files = [item for item in chunk if item[3] is not None]
+            manifest = self._load_manifest(cursor, [item[0] for item in meter_files])
+
+            readings, files = [], []
+            for name, size, mtime, reading, digest, _ in meter_files:
+                if manifest.get(name, (None, None, None))[2] != digest:
+                    readings.append(reading)
+                files.append((name, size, mtime, digest, ingested_at))
+
+            try:
+                with conn:  # readings and manifest in one transaction per chunk
+                    self._save(cursor, readings)
+                    cursor.executemany(
+                        "INSERT OR REPLACE INTO IngestedFiles (FileName, FileSize, FileMTime, ContentHash, IngestedAt) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        files,
+                    )
+            except BaseException:
+                # IDs cached during a rolled back transaction are not valid,
+                # whatever interrupted it (database, parse error, KeyboardInterrupt)
+                self.dimension_cache.clear()
+                raise
+            writer.writerows(readings)
+            yield chunk, len(readings)
+
+    def stream_csv_files_to_db(self, datadir, resultdir, basedir):
+        """
+        Parse CSV files and save them to the database and the csv result file as a stream.
+
+        Readings go to the database in transactions of db_chunk_size readings
+        and are appended to the result file chunk by chunk, so memory use does
+        not grow with the number of files. The result file is in file name order.
+
+        Every ingested file is recorded in the IngestedFiles manifest in the same
+        transaction as its reading; files already in the manifest are skipped.
+
+        Args:
+            datadir (str): The directory containing CSV files to be processed.
+            resultdir (str): The directory where result file will be saved.
+            basedir (str): The base directory where the database file will be located.
+
+        Returns:
+            int: The number of readings processed.
+        """
+        db_path = canonical_path(os.path.join(basedir, self.db_name))
+        snapshot_path = self._snapshot_path(basedir)
+        count = 0
+
+        try:
+            conn = connect(db_path, self.pragmas, self.timeout_seconds)
+            try:
+                cursor = conn.cursor()
+                self.dimension_cache.warm_up(cursor, snapshot_path)
+
+                # skip files the manifest confirms as ingested by an earlier run
+                confirmed, pending, _ = self._split_by_manifest(cursor, self._meter_paths(datadir))
+                if confirmed:
+                    logging.info(f"Skipping {len(confirmed)} files that are already ingested")
+                parsed = (
+                    (os.path.basename(path), size, mtime, reading, digest, None)
+                    for (path, size, mtime), (reading, digest)
+                    in zip(pending, self._iter_parsed([path for path, _, _ in pending], hashed=True))
+                )
+
+                result_file, writer = self._open_result_csv(resultdir)
+                with result_file:
+                    for _, saved in self._ingest_chunks(conn, cursor, parsed, writer):
+                        count += saved
+
+                if snapshot_path:
+                    self.dimension_cache.save_snapshot(cursor, snapshot_path)
+            finally:
+                conn.close()
+
+            logging.info(f"{count} readings streamed to the database successfully.")
+            return count
+        except sqlite3.Error as e:
+            # IDs cached during a rolled back transaction are not valid
+            self.dimension_cache.clear()
+            logging.error(f"An error occurred while saving data to the database: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"An error occurred while reading CSV files: {e}")
+            raise
+
+    def ingest_paths(self, paths, resultdir, basedir):
+        """
+        Save meter files to the database and the csv result file while they are still arriving.
+
+        Like stream_csv_files_to_db, but for an iterable of files, e.g. fed by
+        a download running in another thread. Files are parsed one by one in
+        the order they come in, which is also the order of the result file, and
+        committed every stream_chunk_files files or stream_chunk_seconds.
+
+        Args:
+            paths (iterable): The downloaded files.
+            resultdir (str): The directory where result file will be saved.
+            basedir (str): The base directory where the database file will be located.
+
+        Returns:
+            list: The paths of the files that are stored in the database.
+        """
+        db_path = canonical_path(os.path.join(basedir, self.db_name))
+        snapshot_path = self._snapshot_path(basedir)
+        stored, count = [], 0
+
+        def parse(paths):
+            for path in paths:
+                stat = os.stat(path)
+                name = os.path.basename(path)
+                if fnmatch.fnmatch(name, METER_FILES):
+                    reading, digest = read_meter_file_hashed(path, self.csv_engine)
+                else:
+                    reading, digest = None, None
+                yield name, stat.st_size, stat.st_mtime_ns, reading, digest, path
+
+        try:
+            conn = connect(db_path, self.pragmas, self.timeout_seconds)
+            try:
+                cursor = conn.cursor()
+                self.dimension_cache.warm_up(cursor, snapshot_path)
+
+                result_file, writer = self._open_result_csv(resultdir)
+                with result_file:
+                    for chunk, saved in self._ingest_chunks(conn, cursor, parse(paths), writer, streaming=True):
+                        count += saved
+                        stored.extend(item[5] for item in chunk)
+
+                if snapshot_path:
+                    self.dimension_cache.save_snapshot(cursor, snapshot_path)
+            finally:
+                conn.close()
+
+            logging.info(f"{count} readings from {len(stored)} files streamed to the database successfully.")
+            return stored
+        except sqlite3.Error as e:
+            # IDs cached during a rolled back transaction are not valid
+            self.dimension_cache.clear()
+            logging.error(f"An error occurred while saving data to the database: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"An error occurred while reading CSV files: {e}")
+            raise
+
+    def ingest_buffers(self, files, resultdir, basedir, backupdir):
+        """
+        Save downloaded files straight from memory to the database, the csv result file and a backup archive.
+
+        Meter files are parsed from their buffer and saved like in
+        stream_csv_files_to_db; every file is then written into the archive,
+        so nothing goes through the download folder.
+
+        Args:
+            files (iterable): (filename, bytes, modification time in ns or None) per downloaded file.
+            resultdir (str): The directory where result file will be saved.
+            basedir (str): The base directory where the database file will be located.
+            backupdir (str): The directory where backup archives will be stored.
+
+        Returns:
+            list: The file names that are stored in the database and the archive.
+        """
+        db_path = canonical_path(os.path.join(basedir, self.db_name))
+        snapshot_path = self._snapshot_path(basedir)
+        archive, archived, count = None, [], 0
+
+        def parse(files):
+            for filename, data, mtime in files:
+                name = posixpath.basename(filename)
+                reading = parse_meter_bytes(data) if fnmatch.fnmatch(name, METER_FILES) else None
+                # the remote modification time, so the next listing recognizes the file
+                yield name, len(data), mtime or time.time_ns(), reading, content_hash(data), (filename, data)
+
+        try:
+            conn = connect(db_path, self.pragmas, self.timeout_seconds)
+            try:
+                cursor = conn.cursor()
+                self.dimension_cache.warm_up(cursor, snapshot_path)
+
+                result_file, writer = self._open_result_csv(resultdir)
+                with result_file:
+                    for chunk, saved in self._ingest_chunks(conn, cursor, parse(files), writer, streaming=True):
+                        count += saved
+                        if archive is None:
+                            archive = self._open_archive(backupdir)
+                        for name, _, _, _, _, (filename, data) in chunk:
+                            archive.writestr(data, name)
+                            archived.append(filename)
+
+                if snapshot_path:
+                    self.dimension_cache.save_snapshot(cursor, snapshot_path)
+            finally:
+                conn.close()
+                if archive is not None:
+                    archive.close()
+                    # the remote files are deleted once this returns
+                    commit_archive(archive.filename)
+
+            logging.info(f"{count} readings saved and {len(archived)} files archived from memory successfully.")
+            return archived
+        except sqlite3.Error as e:
+            # IDs cached during a rolled back transaction are not valid
+            self.dimension_cache.clear()
+            logging.error(f"An error occurred while saving data to the database: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"An error occurred while processing downloaded files: {e}")
+            raise
+
+    def backfill_archives(self, archive_paths, basedir):
+        """
+        Replay backup archives into the database, e.g. to rebuild it after corruption.
+
+        The meter files are read from the archives in memory (nothing is
+        extracted to disk) and parsed over the worker pool (parse_workers).
+        The readings are staged in a temporary table on disk and then loaded in one
+        transaction: addresses and meters set-based, readings sorted by
+        (MeterID, ReadingDate) with the covering index built afterwards. Into
+        an empty Readings table the unique index is built afterwards as well.
+        Readings that are already stored are kept. The files are added to the
+        IngestedFiles manifest.
+
+        Args:
+            archive_paths (list): The backup archives, oldest first.
+            basedir (str): The base directory where the database file will be located.
+
+        Returns:
+            int: The number of readings added.
+        """
+        db_path = canonical_path(os.path.join(basedir, self.db_name))
+
+        def members():
+            for archive_path in archive_paths:
+                logging.info(f"Backfilling from {archive_path}")
+                for member, data in iter_members(archive_path):
+                    name = posixpath.basename(member)
+                    if fnmatch.fnmatch(name, METER_FILES):
+                        yield name, data
+
+        conn = connect(db_path, self.pragmas, self.timeout_seconds, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"PRAGMA cache_size = -{BACKFILL_CACHE_KIB}")  # room for the index builds
+            # every archive is staged at once: the staging table and the sorts go to a temporary
+            # file (SQLITE_TMPDIR), whatever the temp_store of the [database] section
+            cursor.execute("PRAGMA temp_store = FILE")
+
+            # Step 1: Stage the readings, the temporary table does not lock the database
+            cursor.execute(
+                "CREATE TEMP TABLE BackfillReadings (FileName TEXT, FileSize INT, ContentHash TEXT, "
+                "MeterName TEXT, AddressText TEXT, ReadingValue INT, ReadingDate DATE)"
+            )
+            rows = (
+                (name, size, digest, reading["MeterName"], reading["AddressName"], reading["MeterValue"], reading["MeterDate"])
+                for name, size, reading, digest in self._iter_parsed_members(members())
+            )
+            staged = 0
+            cursor.execute("BEGIN")
+            while chunk := list(islice(rows, self.db_chunk_size)):
+                cursor.executemany("INSERT INTO temp.BackfillReadings VALUES (?, ?, ?, ?, ?, ?, ?)", chunk)
+                staged += len(chunk)
+            cursor.execute("COMMIT")
+            logging.info(f"Staged {staged} readings")
+
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Step 2: Addresses and meters, set-based
+                cursor.execute(
+                    "INSERT OR IGNORE INTO Addresses (AddressText) "
+                    "SELECT DISTINCT AddressText FROM temp.BackfillReadings"
+                )
+                cursor.execute(
+                    "INSERT OR IGNORE INTO Meters (MeterName, AddressID) "
+                    "SELECT b.MeterName, a.AddressID "
+                    "FROM (SELECT MeterName, MIN(AddressText) AS AddressText FROM temp.BackfillReadings GROUP BY MeterName) b "
+                    "JOIN Addresses a ON a.AddressText = b.AddressText"
+                )
+
+                # Step 3: Readings, sorted, with the indexes built afterwards
+                empty = cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM Readings)").fetchone()[0]
+                deferred = list(READING_INDEXES) if empty else ["MeterReadingDateValue"]
+                for index in deferred:
+                    cursor.execute(f"DROP INDEX IF EXISTS {index}")
+                cursor.execute(
+                    "INSERT OR IGNORE INTO Readings (MeterID, ReadingValue, ReadingDate) "
+                    "SELECT m.MeterID, b.ReadingValue, b.ReadingDate "
+                    "FROM temp.BackfillReadings b JOIN Meters m ON m.MeterName = b.MeterName "
+                    # without the unique index, duplicates are removed here
+                    + ("GROUP BY m.MeterID, b.ReadingDate " if empty else "")
+                    + "ORDER BY m.MeterID, b.ReadingDate"
+                )
+                count = cursor.rowcount
+                for index in deferred:
+                    cursor.execute(READING_INDEXES[index])
+
+                # daily consumption of the backfilled meters, from their earliest backfilled day on
+                cursor.execute(CONSUMPTION_DIRTY)
+                cursor.execute(
+                    "INSERT OR REPLACE INTO temp.ConsumptionDirty (MeterID, FromDay) "
+                    "SELECT m.MeterID, MIN(substr(b.ReadingDate, 1, 10)) "
+                    "FROM temp.BackfillReadings b JOIN Meters m ON m.MeterName = b.MeterName GROUP BY m.MeterID"
+                )
+                refresh_daily_consumption(cursor)
+                cursor.execute("UPDATE DataVersion SET Version = Version + 1")
+
+                # Step 4: The manifest, so these files are not downloaded or parsed again
+                cursor.execute(
+                    "INSERT OR IGNORE INTO IngestedFiles (FileName, FileSize, FileMTime, ContentHash, IngestedAt) "
+                    "SELECT FileName, MIN(FileSize), ?, MIN(ContentHash), ? FROM temp.BackfillReadings GROUP BY FileName",
+                    (time.time_ns(), datetime.now().isoformat(timespec="seconds")),
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+            cursor.execute("DROP TABLE temp.BackfillReadings")
+            cursor.execute("PRAGMA optimize")
+
+            # new IDs: the cache and its snapshot are rebuilt on the next ingest
+            self.dimension_cache.clear()
+            snapshot_path = self._snapshot_path(basedir)
+            if snapshot_path and os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+            logging.info(f"{count} of {staged} readings backfilled from {len(archive_paths)} archives.")
+            return count
+        except sqlite3.Error as e:
+            logging.error(f"An error occurred while backfilling the database: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def _row_save(self, cursor, result_list):
+        """
+        Save readings one by one, resolving address and meter per reading.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor of an open transaction.
+            result_list (list): A list of dictionaries representing processed data.
+
+        Returns:
+            None
+        """
+        data_to_insert = []
+
+        # Iterate through the result list and prepare data for insertion
+        for reading in result_list:
+            # Step 1: Look up the MeterID, inserting Address and Meter on a cache miss
+            meter_id = self.dimension_cache.meter_id(cursor, reading["MeterName"], reading["AddressName"])
+
+            # Step 2: Prepare data for batch insertion into the Readings table
+            data_to_insert.append((meter_id, reading["MeterValue"], reading["MeterDate"]))
+
+        # Step 3: Batch insertion into the Readings table
+        cursor.executemany(
+            "INSERT OR IGNORE INTO Readings (MeterID, ReadingValue, ReadingDate) VALUES (?, ?, ?)",
+            data_to_insert,
+        )
+
+    def _bulk_save(self, cursor, result_list):
+        """
+        Save readings with set-based statements.
+
+        Meters missing from the dimension cache are staged in a temporary
+        table and resolved with one statement for addresses and one for
+        meters. All readings are then inserted in a single batch.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor of an open transaction.
+            result_list (list): A list of dictionaries representing processed data.
+
+        Returns:
+            None
+        """
+        meter_ids = self.dimension_cache.meter_ids
+        missing = {
+            reading["MeterName"]: reading["AddressName"]
+            for reading in result_list
+            if reading["MeterName"] not in meter_ids
+        }
+
+        if missing:
+            cursor.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS StagedMeters (MeterName TEXT, AddressText TEXT)"
+            )
+            cursor.execute("DELETE FROM temp.StagedMeters")
+
+            # Step 1: Stage the meters missing from the cache
+            cursor.executemany(
+                "INSERT INTO temp.StagedMeters (MeterName, AddressText) VALUES (?, ?)",
+                missing.items(),
+            )
+
+            # Step 2: Insert all new AddressTexts into the Addresses table
+            cursor.execute(
+                "INSERT OR IGNORE INTO Addresses (AddressText) "
+                "SELECT DISTINCT s.AddressText FROM temp.StagedMeters s "
+                "WHERE NOT EXISTS (SELECT 1 FROM Addresses a WHERE a.AddressText = s.AddressText)"
+            )
+
+            # Step 3: Insert all new MeterNames into the Meters table
+            cursor.execute(
+                "INSERT OR IGNORE INTO Meters (MeterName, AddressID) "
+                "SELECT s.MeterName, (SELECT MIN(a.AddressID) FROM Addresses a WHERE a.AddressText = s.AddressText) "
+                "FROM temp.StagedMeters s "
+                "WHERE NOT EXISTS (SELECT 1 FROM Meters m WHERE m.MeterName = s.MeterName)"
+            )
+
+            # Step 4: Fetch the IDs of the staged meters into the cache
+            cursor.execute(
+                "SELECT s.AddressText, (SELECT MIN(a.AddressID) FROM Addresses a WHERE a.AddressText = s.AddressText), "
+                "s.MeterName, (SELECT MIN(m.MeterID) FROM Meters m WHERE m.MeterName = s.MeterName) "
+                "FROM temp.StagedMeters s"
+            )
+            resolved = cursor.fetchall()
+            self.dimension_cache.update(
+                ((address_text, address_id) for address_text, address_id, _, _ in resolved),
+                ((meter_name, meter_id) for _, _, meter_name, meter_id in resolved),
+            )
+
+            cursor.execute("DELETE FROM temp.StagedMeters")
+
+        # Step 5: Batch insertion into the Readings table
+        cursor.executemany(
+            "INSERT OR IGNORE INTO Readings (MeterID, ReadingValue, ReadingDate) VALUES (?, ?, ?)",
+            (
+                (meter_ids[reading["MeterName"]], reading["MeterValue"], reading["MeterDate"])
+                for reading in result_list
+            ),
+        )
+
+    def confirmed_files(self, datadir, basedir):
+        """
+        Meter files in a directory that the manifest confirms as ingested.
+
+        Args:
+            datadir (str): The directory containing CSV files.
+            basedir (str): The base directory where the database file will be located.
+
+        Returns:
+            set: Paths of the confirmed files.
+        """
+        db_path = canonical_path(os.path.join(basedir, self.db_name))
+        conn = connect(db_path, self.pragmas, self.timeout_seconds)
+        try:
+            confirmed, _, _ = self._split_by_manifest(conn.cursor(), self._meter_paths(datadir))
+            return set(confirmed)
+        finally:
+            conn.close()
+
+    def _open_archive(self, backupdir):
+        """
+        Create a new backup archive named after the current time.
+
+        A second archive in the same second gets a counter, e.g. 20231005@120000-1.7z.
+
+        Args:
+            backupdir (str): The directory where backup archives will be stored.
+
+        Returns:
+            The archive, opened for writing with the [archive] codec, see archive_backend.open_new_archive.
+        """
+        if not os.path.exists(backupdir):
+            os.makedirs(backupdir)
+
+        current_time = datetime.now().strftime("%Y%m%d@%H%M%S")
+        return open_new_archive(
+            os.path.join(backupdir, current_time),
+            self.archive_codec,
+            self.archive_level,
+            self.archive_threads,
+        )
+
+    def archive_files(self, datadir, backupdir, basedir=None):
         """
         Archive files and remove original files.
 
+        The archive is written with the [archive] codec, level and threads
+        (see archive_backend); the originals are removed only after the archive
+        is closed and flushed to disk.
+
+        With [basedir], meter files are only archived once the manifest in the
+        database confirms them as ingested; other files are archived as before.
+
         Args:
             datadir (str): The directory containing files to be archived.
             backupdir (str): The directory where backup archives will be stored.
+            basedir (str): The base directory where the database file will be located.
 
         Returns:
-            str: The path to the created backup archive.
+            str: The path to the created backup archive, None if there was nothing to archive.
         """
         # datadir = canonical_path(datadir)
         # backupdir = canonical_path(backupdir)
@@ -203,19 +941,39 @@ class DataManager:
             if not os.path.exists(backupdir):
                 os.makedirs(backupdir)
 
-            current_time = datetime.now().strftime("%Y%m%d@%H%M%S")
-            backup_archive_path = os.path.join(backupdir, f'{current_time}.7z')
-
-            with SevenZipFile(backup_archive_path, 'w') as archive:
-                for root, _, files in os.walk(datadir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
+            file_paths = [
+                os.path.join(root, file)
+                for root, _, files in os.walk(datadir)
+                for file in files
+                if not file.endswith(PARTIAL_SUFFIX)  # interrupted downloads, resumed next run
+            ]
+
+            if basedir:
+                unconfirmed = set(self._meter_paths(datadir)) - self.confirmed_files(datadir, basedir)
+                if unconfirmed:
+                    logging.warning(f"Not archiving {len(unconfirmed)} files that are not ingested yet")
+                    file_paths = [file_path for file_path in file_paths if file_path not in unconfirmed]
+
+            if not file_paths:
+                logging.info("No files to archive.")
+                return None
+
+            archive = self._open_archive(backupdir)
+            backup_archive_path = archive.filename
+            try:
+                with archive:
+                    for file_path in file_paths:
                         archive.write(file_path, os.path.relpath(file_path, datadir))
-
-            for root, _, files in os.walk(datadir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    os.remove(file_path)
+            except BaseException:
+                # an incomplete archive would hold the files a second time after the next run
+                if os.path.exists(backup_archive_path):
+                    os.remove(backup_archive_path)
+                raise
+
+            # the originals go only once the archive is closed and on disk
+            commit_archive(backup_archive_path)
+            for file_path in file_paths:
+                os.remove(file_path)
 
             logging.info("Files archived and originals removed successfully.")
             return backup_archive_path
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory cache of the address and meter IDs.
+"""
+
+import os
+import json
+import logging
+
+
+class DimensionCache:
+    """
+    In-process cache of the dimension tables (AddressText->AddressID, MeterName->MeterID).
+
+    The cache is filled once per run, from an on-disk snapshot when that still
+    matches the database, otherwise from the Addresses and Meters tables.
+    Lookups only go to the database on a miss.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty DimensionCache.
+
+        Returns:
+            None
+        """
+        self.address_ids = {}
+        self.meter_ids = {}
+        self.loaded = False
+        logging.info(self.__class__.__name__)
+
+    def _watermark(self, cursor):
+        """
+        Cheap fingerprint of the dimension tables: highest IDs and schema version.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor on the database.
+
+        Returns:
+            list: [MAX(AddressID), MAX(MeterID), user_version]
+        """
+        cursor.execute("SELECT (SELECT MAX(AddressID) FROM Addresses), (SELECT MAX(MeterID) FROM Meters)")
+        max_address_id, max_meter_id = cursor.fetchone()
+        user_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        return [max_address_id, max_meter_id, user_version]
+
+    def warm_up(self, cursor, snapshot_path=None):
+        """
+        Fill the cache, unless it is already filled for this run.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor on the database.
+            snapshot_path (str): Optional snapshot file to load from.
+
+        Returns:
+            None
+        """
+        if self.loaded:
+            return
+
+        if snapshot_path and self._load_snapshot(cursor, snapshot_path):
+            logging.info(f"Dimension cache loaded from snapshot {snapshot_path}")
+        else:
+            self._load_tables(cursor)
+            logging.info("Dimension cache loaded from database")
+
+        self.loaded = True
+
+    def _load_tables(self, cursor):
+        cursor.execute("SELECT AddressText, MIN(AddressID) FROM Addresses GROUP BY AddressText")
+        self.address_ids = dict(cursor.fetchall())
+        cursor.execute("SELECT MeterName, MIN(MeterID) FROM Meters GROUP BY MeterName")
+        self.meter_ids = dict(cursor.fetchall())
+
+    def _load_snapshot(self, cursor, snapshot_path):
+        """
+        Load the snapshot if it was taken from the current state of the database.
+
+        Returns:
+            bool: True if the snapshot was loaded, False otherwise.
+        """
+        try:
+            with open(snapshot_path, "r", encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring dimension snapshot {snapshot_path}: {e}")
+            return False
+
+        if snapshot.get("watermark") != self._watermark(cursor):
+            logging.info(f"Dimension snapshot {snapshot_path} is outdated")
+            return False
+
+        self.address_ids = snapshot["addresses"]
+        self.meter_ids = snapshot["meters"]
+        return True
+
+    def save_snapshot(self, cursor, snapshot_path):
+        """
+        Write the cache to disk. Call only after the transaction is committed.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor on the database.
+            snapshot_path (str): The snapshot file.
+
+        Returns:
+            None
+        """
+        snapshot = {
+            "watermark": self._watermark(cursor),
+            "addresses": self.address_ids,
+            "meters": self.meter_ids,
+        }
+        temp_path = f"{snapshot_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            os.replace(temp_path, snapshot_path)
+        except OSError as e:
+            # the snapshot only speeds up the next start; a failure is not fatal
+            logging.warning(f"Cannot write dimension snapshot {snapshot_path}: {e}")
+
+    def clear(self):
+        """
+        Forget all entries, e.g. after a rollback made them unreliable.
+
+        Returns:
+            None
+        """
+        self.address_ids = {}
+        self.meter_ids = {}
+        self.loaded = False
+
+    def address_id(self, cursor, address_text):
+        """
+        Get the AddressID for [address_text], inserting the address on a miss.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor of an open transaction.
+            address_text (str): The address.
+
+        Returns:
+            int: The AddressID.
+        """
+        address_id = self.address_ids.get(address_text)
+        if address_id is None:
+            cursor.execute("SELECT MIN(AddressID) FROM Addresses WHERE AddressText = ?", (address_text,))
+            address_id = cursor.fetchone()[0]
+            if address_id is None:
+                cursor.execute("INSERT INTO Addresses (AddressText) VALUES (?)", (address_text,))
+                address_id = cursor.lastrowid
+            self.address_ids[address_text] = address_id
+        return address_id
+
+    def meter_id(self, cursor, meter_name, address_text):
+        """
+        Get the MeterID for [meter_name], inserting meter and address on a miss.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor of an open transaction.
+            meter_name (str): The meter.
+            address_text (str): The address of the meter.
+
+        Returns:
+            int: The MeterID.
+        """
+        meter_id = self.meter_ids.get(meter_name)
+        if meter_id is None:
+            cursor.execute("SELECT MIN(MeterID) FROM Meters WHERE MeterName = ?", (meter_name,))
+            meter_id = cursor.fetchone()[0]
+            if meter_id is None:
+                address_id = self.address_id(cursor, address_text)
+                cursor.execute(
+                    "INSERT INTO Meters (MeterName, AddressID) VALUES (?, ?)",
+                    (meter_name, address_id),
+                )
+                meter_id = cursor.lastrowid
+            self.meter_ids[meter_name] = meter_id
+        return meter_id
+
+    def update(self, addresses, meters):
+        """
+        Add resolved (text, ID) pairs, e.g. from a set-based insert.
+
+        Args:
+            addresses (iterable): (AddressText, AddressID) pairs.
+            meters (iterable): (MeterName, MeterID) pairs.
+
+        Returns:
+            None
+        """
+        self.address_ids.update(addresses)
+        self.meter_ids.update(meters)
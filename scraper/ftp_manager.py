@@ -6,9 +6,19 @@ Created on Tue Sep 26 17:03:02 2023
 @author: jules
 """
 
+import io
 import os
+import re
+import glob
 import logging
-from ftplib import FTP
+import time
+import posixpath
+import threading
+from ftplib import FTP, all_errors, error_perm, error_temp, error_reply
+from collections import deque, namedtuple
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor
 
 # add workspace-path to the %PATH% env
 import sys
@@ -16,9 +26,24 @@ sys.path.append(".")
 
 # local modules
 from core.utils import canonical_path
+from scraper.csv_reader import content_hash
 
 # Constants
 FTP_SUCCESS_CODE = "226"
+PARTIAL_SUFFIX = ".part" # incomplete downloads, resumed with REST while the remote file is unchanged
+RETRY_ERRORS = (OSError, EOFError, error_temp, error_reply) # dropped link, timeouts, 4xx replies
+
+# A file in the remote directory; size and modify (timezone-aware datetime) are None when unknown,
+# resolution is the precision of modify in seconds
+RemoteFile = namedtuple("RemoteFile", ["name", "size", "modify", "resolution"], defaults=[0])
+
+# LIST output: unix ('-rw-r--r-- 1 owner group 3725 Sep 10 12:00 name') and DOS/IIS ('09-10-23  12:00AM  3725 name')
+LIST_UNIX = re.compile(r"^([-dl])\S+\s+\d+\s+\S+\s+\S+\s+(\d+)\s+(\w{3}\s+\d{1,2}\s+(?:\d{4}|\d{1,2}:\d{2}))\s+(.+)$")
+LIST_DOS = re.compile(r"^(\d{2}-\d{2}-\d{2,4}\s+\d{1,2}:\d{2}[AP]M)\s+(<DIR>|\d+)\s+(.+)$", re.IGNORECASE)
+# a LIST time without a year that is further ahead than this is from last year;
+# closer ones are clock skew between server and scraper
+LIST_FUTURE_TOLERANCE = timedelta(days=1)
+LIST_RESOLUTION_SECONDS = 60 # LIST times have no seconds
 
 class FTPManager:
     def __init__(self, config):
@@ -34,9 +59,29 @@ class FTPManager:
         self.config = config
         self.ftp = FTP()
         self.remote_directory = self.config.get("ftp", "remote_directory")
+        self.connections = self.config.getint("ftp", "ftp_connections", 1)
+        self.transfer_mode = self.config.get("ftp", "transfer_mode", "disk")
+        self.settle_seconds = self.config.getint("ftp", "settle_seconds", 60)
+        self.max_batch_bytes = self.config.getint("ftp", "max_batch_bytes", 0)
+        self.max_retries = self.config.getint("ftp", "max_retries", 3)
+        self.retry_backoff_seconds = float(self.config.get("ftp", "retry_backoff_seconds", 2))
+        self.server_timezone = self._timezone(self.config.get("ftp", "server_timezone", "UTC"))
+        self._partial_buffers = {} # filename -> (remote stat, BytesIO) of an interrupted in-memory download
+        self._remote_stat = {} # filename -> (size, modification time in ns) of the last listing, when both are known
+        self.keep_sessions = False # keep the pooled sessions logged in between batches, see close
+        self._idle_sessions = [] # pooled sessions between batches
+        self._idle_lock = threading.Lock()
         self.timeout_seconds = 20
         logging.info(self.__class__.__name__)
 
+    @staticmethod
+    def _timezone(name):
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError) as e:
+            logging.error(f"Unknown server_timezone {name} ({e}), using UTC")
+            return timezone.utc
+
     def connect(self):
         """
         Connect to the FTP server using the provided configuration.
@@ -45,20 +90,106 @@ class FTPManager:
             bool: True if the connection is successful, False otherwise.
         """
         try:
-            ftp_server = self.config.get("ftp", "ftp_server")
-            ftp_port = int(self.config.get("ftp", "ftp_port"))
-            ftp_user = self.config.get("ftp", "ftp_user")
-            ftp_password = self.config.get("ftp", "ftp_password")
-
-            self.ftp.connect(ftp_server, ftp_port, timeout=self.timeout_seconds)
-            self.ftp.login(ftp_user, ftp_password)
-
-            logging.info(f"Connected to FTP server: {ftp_server}:{ftp_port}")
+            self._login(self.ftp)
             return True
         except Exception as e:
             logging.error(f"Failed to connect to FTP server: {e}")
             return False
 
+    def keep_alive(self):
+        """
+        Send a NOOP on the main session and on the idle pooled sessions, so the
+        server does not close them while idle. Pooled sessions that are lost are dropped.
+
+        Returns:
+            bool: True if the main session is alive, False otherwise.
+        """
+        with self._idle_lock:
+            idle, self._idle_sessions = self._idle_sessions, []
+        alive = [ftp for ftp in idle if self._noop(ftp)]
+        with self._idle_lock:
+            self._idle_sessions.extend(alive)
+
+        try:
+            self.ftp.voidcmd("NOOP")
+            return True
+        except all_errors + (AttributeError,) as e:  # AttributeError: session never connected
+            logging.warning(f"FTP session lost: {e}")
+            return False
+
+    @staticmethod
+    def _noop(ftp):
+        try:
+            ftp.voidcmd("NOOP")
+            return True
+        except all_errors as e:
+            logging.info(f"Pooled FTP session lost: {e}")
+            ftp.close()
+            return False
+
+    def _idle_session(self):
+        """
+        Take a pooled session that is still logged in, see keep_sessions.
+
+        Returns:
+            FTP: The session, None when there is none.
+        """
+        while True:
+            with self._idle_lock:
+                if not self._idle_sessions:
+                    return None
+                ftp = self._idle_sessions.pop()
+            if self._noop(ftp):
+                return ftp
+
+    def close(self):
+        """
+        Log out the main session and the pooled sessions.
+
+        Returns:
+            None
+        """
+        with self._idle_lock:
+            sessions, self._idle_sessions = [self.ftp] + self._idle_sessions, []
+        for ftp in sessions:
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+
+    def reconnect(self):
+        """
+        Replace the main session by a new one. The idle pooled sessions are
+        kept; each one gets a NOOP before it is used again.
+
+        Returns:
+            bool: True if the connection is successful, False otherwise.
+        """
+        self.ftp.close()
+        self.ftp = FTP()
+        return self.connect()
+
+    def _login(self, ftp):
+        """
+        Connect and log in an FTP session.
+
+        Args:
+            ftp (FTP): The session.
+
+        Returns:
+            FTP: The logged in session.
+        """
+        ftp_server = self.config.get("ftp", "ftp_server")
+        ftp_port = int(self.config.get("ftp", "ftp_port"))
+        ftp_user = self.config.get("ftp", "ftp_user")
+        ftp_password = self.config.get("ftp", "ftp_password")
+
+        ftp.connect(ftp_server, ftp_port, timeout=self.timeout_seconds)
+        ftp.login(ftp_user, ftp_password)
+
+        logging.info(f"Connected to FTP server: {ftp_server}:{ftp_port}")
+        return ftp
+
     def list_remote_files(self):
         """
         List files in the remote directory of the FTP server.
@@ -73,49 +204,535 @@ class FTPManager:
             logging.error(f"Error listing files on the FTP server: {e}")
             return []
 
-    def download_files(self, download_directory):
+    def list_remote_entries(self):
+        """
+        List files in the remote directory with size and modification time.
+
+        Uses MLSD and falls back to parsing LIST output when the server does
+        not support it. Directories are left out.
+
+        Returns:
+            list: A list of RemoteFile.
+        """
+        try:
+            try:
+                return [
+                    RemoteFile(
+                        name,
+                        int(facts["size"]) if "size" in facts else None,
+                        self._parse_mlsd_time(facts.get("modify")),
+                    )
+                    for name, facts in self.ftp.mlsd(self.remote_directory, facts=["type", "size", "modify"])
+                    if facts.get("type", "file") == "file"
+                ]
+            except error_perm as e:
+                logging.info(f"MLSD not supported ({e}), falling back to LIST")
+
+            lines = []
+            self.ftp.retrlines(f"LIST {self.remote_directory}", lines.append)
+            return [entry for entry in (self._parse_list_line(line, self.server_timezone) for line in lines) if entry]
+        except Exception as e:
+            logging.error(f"Error listing files on the FTP server: {e}")
+            return []
+
+    @staticmethod
+    def _parse_mlsd_time(value):
+        # MLSD times are UTC, YYYYMMDDHHMMSS[.sss]
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value[:14], "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _parse_list_line(line, server_timezone=timezone.utc):
+        """
+        Parse one line of LIST output.
+
+        Unlike MLSD, LIST shows the local time of the server, see server_timezone.
+
+        Args:
+            line (str): The line.
+            server_timezone (tzinfo): The time zone of the server.
+
+        Returns:
+            RemoteFile: The file, None for directories and lines that cannot be parsed.
+        """
+        match = LIST_UNIX.match(line)
+        if match:
+            kind, size, stamp, name = match.groups()
+            if kind == "d":
+                return None
+            if kind == "l":
+                name = name.split(" -> ")[0]
+            stamp = " ".join(stamp.split())
+            try:
+                if ":" in stamp:
+                    # recent files show the time instead of the year
+                    now = datetime.now(server_timezone)
+                    modify = datetime.strptime(f"{now.year} {stamp}", "%Y %b %d %H:%M").replace(tzinfo=server_timezone)
+                    if modify > now + LIST_FUTURE_TOLERANCE:
+                        modify = modify.replace(year=now.year - 1)
+                else:
+                    modify = datetime.strptime(stamp, "%b %d %Y").replace(tzinfo=server_timezone)
+            except ValueError:
+                modify = None
+            return RemoteFile(name, int(size), modify, LIST_RESOLUTION_SECONDS)
+
+        match = LIST_DOS.match(line)
+        if match:
+            stamp, size, name = match.groups()
+            if size.upper() == "<DIR>":
+                return None
+            stamp = " ".join(stamp.split()).upper()
+            modify = None
+            for time_format in ("%m-%d-%y %I:%M%p", "%m-%d-%Y %I:%M%p"):
+                try:
+                    modify = datetime.strptime(stamp, time_format).replace(tzinfo=server_timezone)
+                    break
+                except ValueError:
+                    pass
+            return RemoteFile(name, int(size), modify, LIST_RESOLUTION_SECONDS)
+
+        if not line.startswith("total "):
+            logging.warning(f"Cannot parse LIST line: {line}")
+        return None
+
+    def _download_file(self, ftp, filename, download_directory):
+        """
+        Download one file and remove it from the server after a confirmed transfer.
+
+        The file is written under a temporary name (PARTIAL_SUFFIX) and renamed once
+        complete. A partial file left by a failed attempt, in this run or an earlier
+        one, is resumed with REST instead of being transferred again, if the remote
+        file still has the size and modification time of that attempt: the name of
+        the partial file holds them, see _partial_path. Other partial files of the
+        same name are removed, meters reuse file names.
+
+        Args:
+            ftp (FTP): A logged in session.
+            filename (str): The remote file name.
+            download_directory (str): The local directory where the file will be downloaded.
+
+        Returns:
+            str: The local path, None if the transfer was not confirmed.
+        """
+        remote_path = os.path.join(self.remote_directory, filename)
+        local_path = os.path.join(download_directory, posixpath.basename(filename))
+        stat = self._remote_stat.get(filename)
+        partial_path = self._partial_path(local_path, stat)
+        for stale_path in glob.glob(glob.escape(local_path) + ".*" + PARTIAL_SUFFIX) + [local_path + PARTIAL_SUFFIX]:
+            if stale_path != partial_path and os.path.exists(stale_path):
+                logging.info(f"Discarding {stale_path}, the remote file changed")
+                os.remove(stale_path)
+        offset = os.path.getsize(partial_path) if stat and os.path.exists(partial_path) else 0
+
+        try:
+            with open(partial_path, "ab") as local_file:
+                ftp_response = ftp.retrbinary(f"RETR {remote_path}", local_file.write, rest=offset or None)
+        except error_perm as e:
+            if not offset:
+                raise
+            # the server refuses the offset, e.g. the remote file was replaced: start over
+            logging.warning(f"Cannot resume {filename} at {offset} bytes ({e}), restarting")
+            os.remove(partial_path)
+            return self._download_file(ftp, filename, download_directory)
+
+        # Check if the local file exists before deleting the remote file
+        # if os.path.exists(local_path):
+        if FTP_SUCCESS_CODE in ftp_response:
+            os.replace(partial_path, local_path)
+            if stat:
+                # the manifest records the remote modification time, see _select_remote_files
+                os.utime(local_path, ns=(stat[1], stat[1]))
+            ftp.delete(remote_path)  # Remove the file from the FTP server
+            logging.info(f"Downloaded and deleted remote file: {filename} ({ftp_response})")
+            return local_path
+
+        logging.error(f"Downloaded file does not exist: {local_path}")
+        return None
+
+    @staticmethod
+    def _partial_path(local_path, stat):
+        """
+        Path of the partial download of a remote file with the given stat.
+
+        Args:
+            local_path (str): The local path of the complete file.
+            stat (tuple): (size, modification time in ns) of the remote file, None when unknown.
+
+        Returns:
+            str: The path; without a stat, the partial file is never resumed.
+        """
+        if stat is None:
+            return local_path + PARTIAL_SUFFIX
+        size, modify = stat
+        return f"{local_path}.{size}-{modify}{PARTIAL_SUFFIX}"
+
+    def _fetch_file(self, ftp, filename):
+        """
+        Download one file into memory. The remote file is kept, see delete_remote_files.
+
+        The buffer of a failed attempt is kept and resumed with REST on the next
+        one, if the remote file still has the size and modification time of that
+        attempt. Buffers are dropped at the end of fetch_files.
+
+        Args:
+            ftp (FTP): A logged in session.
+            filename (str): The remote file name.
+
+        Returns:
+            tuple: (filename, bytes, modification time in ns or None), None if the transfer was not confirmed.
+        """
+        remote_path = os.path.join(self.remote_directory, filename)
+        stat = self._remote_stat.get(filename)
+        partial_stat, buffer = self._partial_buffers.get(filename, (None, None))
+        if buffer is None or stat is None or partial_stat != stat:
+            buffer = io.BytesIO()
+            self._partial_buffers[filename] = (stat, buffer)
+        offset = buffer.tell()
+
+        try:
+            ftp_response = ftp.retrbinary(f"RETR {remote_path}", buffer.write, rest=offset or None)
+        except error_perm as e:
+            if not offset:
+                raise
+            logging.warning(f"Cannot resume {filename} at {offset} bytes ({e}), restarting")
+            del self._partial_buffers[filename]
+            return self._fetch_file(ftp, filename)
+
+        if FTP_SUCCESS_CODE in ftp_response:
+            logging.info(f"Downloaded remote file: {filename} ({ftp_response})")
+            del self._partial_buffers[filename]
+            return filename, buffer.getvalue(), stat[1] if stat else None
+
+        logging.error(f"Download not confirmed: {filename} ({ftp_response})")
+        return None
+
+    def _delete_if_stored(self, ftp, filename, digest):
+        """
+        Download one file into memory and remove it from the server if its content hash is [digest].
+
+        Args:
+            ftp (FTP): A logged in session.
+            filename (str): The remote file name.
+            digest (str): Content hash of the stored file, see content_hash.
+
+        Returns:
+            bool: True if the file was stored and is deleted, False if its content differs.
+        """
+        buffer = io.BytesIO()
+        ftp.retrbinary(f"RETR {os.path.join(self.remote_directory, filename)}", buffer.write)
+        if content_hash(buffer.getvalue()) != digest:
+            return False
+        self._delete_file(ftp, filename)
+        return True
+
+    def _delete_file(self, ftp, filename):
+        ftp.delete(os.path.join(self.remote_directory, filename))
+        logging.info(f"Deleted remote file: {filename}")
+        return filename
+
+    def _run_with_retries(self, task, filename, session, reset_session, give_up):
+        """
+        Run task(ftp, filename), logging in again and retrying after a connection error.
+
+        Waits retry_backoff_seconds, doubling per attempt, for at most max_retries
+        retries. When a file runs out of retries the link is considered down:
+        [give_up] is set and the remaining files of the batch are not attempted.
+
+        Args:
+            task (callable): Function of (ftp, filename).
+            filename (str): The remote file name.
+            session (callable): Returns a logged in session.
+            reset_session (callable): Drops the session after an error.
+            give_up (threading.Event): Set when the batch is abandoned.
+
+        Returns:
+            The result of task, None for a failed file.
+        """
+        for attempt in range(self.max_retries + 1):
+            if give_up.is_set():
+                return None
+            try:
+                return task(session(), filename)
+            except error_perm as e:
+                logging.error(f"Error transferring {filename}: {e}")
+                return None
+            except RETRY_ERRORS as e:
+                reset_session()
+                if attempt == self.max_retries:
+                    logging.error(f"Giving up on {filename} after {attempt + 1} attempts: {e}")
+                    give_up.set()
+                    return None
+                delay = self.retry_backoff_seconds * 2 ** attempt
+                logging.warning(f"Error transferring {filename}: {e}, retry {attempt + 1} in {delay}s")
+                time.sleep(delay)
+
+    def _map_sessions(self, task, filenames):
+        """
+        Run task(ftp, filename) for every file, concurrently over a pool of
+        ftp_connections sessions (one per worker thread) or serially over the
+        main session.
+
+        A session that fails is dropped and logged in again for the retry, see
+        _run_with_retries. Results come in the order of [filenames]; at most two
+        files per session are in flight. With keep_sessions the pooled sessions
+        stay logged in for the next batch, otherwise they are logged out.
+
+        Args:
+            task (callable): Function of (ftp, filename).
+            filenames (list): The remote file names.
+
+        Yields:
+            The result of task, None for a failed file.
+        """
+        give_up = threading.Event()
+
+        if self.connections <= 1 or len(filenames) <= 1:
+            logged_in = [True]
+
+            def main_session():
+                if not logged_in[0]:
+                    self._login(self.ftp)
+                    logged_in[0] = True
+                return self.ftp
+
+            def reset_main_session():
+                self.ftp.close()
+                self.ftp = FTP()
+                logged_in[0] = False
+
+            for filename in filenames:
+                yield self._run_with_retries(task, filename, main_session, reset_main_session, give_up)
+            return
+
+        local = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+
+        def pooled_session():
+            if getattr(local, "ftp", None) is None:
+                local.ftp = self._idle_session() or self._login(FTP())
+                with sessions_lock:
+                    sessions.append(local.ftp)
+            return local.ftp
+
+        def reset_pooled_session():
+            if getattr(local, "ftp", None) is not None:
+                local.ftp.close()
+                with sessions_lock:
+                    sessions.remove(local.ftp)
+            local.ftp = None
+
+        def run(filename):
+            try:
+                return self._run_with_retries(task, filename, pooled_session, reset_pooled_session, give_up)
+            except Exception as e:
+                logging.error(f"Error transferring {filename}: {e}")
+                reset_pooled_session()
+                return None
+
+        workers = min(self.connections, len(filenames))
+        logging.info(f"Transferring {len(filenames)} files over {workers} FTP sessions")
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for filename in filenames:
+                    pending.append(executor.submit(run, filename))
+                    if len(pending) >= 2 * workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        finally:
+            if self.keep_sessions:
+                with self._idle_lock:
+                    self._idle_sessions.extend(sessions)
+            else:
+                for ftp in sessions:
+                    try:
+                        ftp.quit()
+                    except Exception:
+                        ftp.close()
+
+    def _select_remote_files(self, known_files=None):
+        """
+        Choose the CSV files to transfer, using the size and modification time of the listing.
+
+        - files modified less than settle_seconds ago are still being written by
+          the meter and are left for the next run; the window grows by the
+          resolution of the listed time, a minute for LIST;
+        - files that [known_files] reports with the same size and modification
+          time are probably stored already: their content hash is checked
+          against the stored one, since meters reuse file names with nearly the
+          same size. Confirmed files are deleted from the server, the others
+          are transferred like new files;
+        - the rest is ordered largest first, so the session pool stays busy, and
+          capped at max_batch_bytes per run (0: no cap).
+
+        Args:
+            known_files (callable): Optional function of a list of file names, returning
+                {file name: (size, mtime in ns, content hash)} for the files already stored.
+
+        Returns:
+            list: The file names to transfer.
+        """
+        entries = [entry for entry in self.list_remote_entries() if entry.name.lower().endswith(".csv")]
+
+        now = datetime.now(timezone.utc)
+        settled = []
+        for entry in entries:
+            if self.settle_seconds and entry.modify and \
+                    (now - entry.modify).total_seconds() < self.settle_seconds + entry.resolution:
+                logging.info(f"Skipping {entry.name}, modified {entry.modify.isoformat()}, still being written")
+            else:
+                settled.append(entry)
+
+        self._remote_stat = {
+            entry.name: (entry.size, int(entry.modify.timestamp()) * 1_000_000_000)
+            for entry in settled
+            if entry.size is not None and entry.modify
+        }
+        known = known_files([posixpath.basename(entry.name) for entry in settled]) if known_files and settled else {}
+        stored, pending = {}, []
+        for entry in settled:
+            stat = self._remote_stat.get(entry.name)
+            size, mtime, digest = known.get(posixpath.basename(entry.name), (None, None, None))
+            if stat and (size, mtime) == stat:
+                stored[entry.name] = (entry, digest)
+            else:
+                pending.append(entry)
+
+        if stored:
+            names = list(stored)
+            confirm = lambda ftp, filename: self._delete_if_stored(ftp, filename, stored[filename][1])
+            deleted = 0
+            for name, confirmed in zip(names, self._map_sessions(confirm, names)):
+                if confirmed:
+                    deleted += 1
+                elif confirmed is False:
+                    pending.append(stored[name][0])
+            logging.info(f"{deleted} of {len(stored)} remote files were stored already, deleted from the server")
+
+        pending.sort(key=lambda entry: entry.size or 0, reverse=True)
+        if self.max_batch_bytes:
+            batch, batch_bytes = [], 0
+            for entry in pending:
+                if batch and batch_bytes + (entry.size or 0) > self.max_batch_bytes:
+                    break
+                batch.append(entry)
+                batch_bytes += entry.size or 0
+            if len(batch) < len(pending):
+                logging.info(f"Transferring {len(batch)} of {len(pending)} files ({batch_bytes} bytes) in this run")
+            pending = batch
+
+        return [entry.name for entry in pending]
+
+    def download_files(self, download_directory, known_files=None):
         """
         Download CSV files from the FTP server to the local directory.
 
+        With ftp_connections > 1 the files are fetched concurrently over that
+        many sessions; a remote file is only deleted after its own transfer is
+        confirmed. Files that are already stored (see _select_remote_files) or
+        already in the download directory with the same content are deleted
+        from the server instead.
+
         Args:
             download_directory (str): The local directory where files will be downloaded.
+            known_files (callable): Optional lookup of already stored files, see _select_remote_files.
 
         Returns:
             list: A list of downloaded CSV file paths.
         """
+        return list(self.iter_download_files(download_directory, known_files))
+
+    def iter_download_files(self, download_directory, known_files=None):
+        """
+        Download CSV files like download_files, yielding each file as soon as it is complete.
+
+        Args:
+            download_directory (str): The local directory where files will be downloaded.
+            known_files (callable): Optional lookup of already stored files, see _select_remote_files.
+
+        Yields:
+            str: The path of a downloaded CSV file.
+        """
         # download_directory = canonical_path(download_directory)
 
         try:
             if not os.path.exists(download_directory):
                 os.makedirs(download_directory, exist_ok=True)
 
-            csv_list = []
-            remote_files = self.list_remote_files()
+            def stored_files(names):
+                # files left in the download folder by an interrupted run count as stored too
+                stored = known_files(names) if known_files else {}
+                for name in names:
+                    local_path = os.path.join(download_directory, name)
+                    if os.path.isfile(local_path):
+                        stat = os.stat(local_path)
+                        with open(local_path, "rb") as local_file:
+                            stored[name] = (stat.st_size, stat.st_mtime_ns, content_hash(local_file.read()))
+                return stored
 
-            for filename in remote_files:
-                if filename.lower().endswith(".csv"):
-                    remote_path = os.path.join(self.remote_directory, filename)
-                    local_path = os.path.join(download_directory, filename)
+            remote_files = self._select_remote_files(stored_files)
+            download = lambda ftp, filename: self._download_file(ftp, filename, download_directory)
 
-                    with open(local_path, "wb") as local_file:
-                        ftp_response = self.ftp.retrbinary(f"RETR {remote_path}", local_file.write)
+            for local_path in self._map_sessions(download, remote_files):
+                if local_path:
+                    yield local_path
+        except Exception as e:
+            logging.error(f"Error downloading files: {e}")
 
-                    # Check if the local file exists before deleting the remote file
-                    # if os.path.exists(local_path):
-                    if FTP_SUCCESS_CODE in ftp_response:
-                        self.ftp.delete(remote_path)  # Remove the file from the FTP server
-                        logging.info(f"Downloaded and deleted remote file: {filename} ({ftp_response})")
-                        csv_list.append(local_path)
-                    else:
-                        logging.error(f"Downloaded file does not exist: {local_path}")
+    def fetch_files(self, known_files=None):
+        """
+        Download CSV files from the FTP server into memory.
+
+        Unlike download_files, the remote files are not deleted: call
+        delete_remote_files once their content is safely stored. Files that
+        are already stored are deleted from the server instead, see
+        _select_remote_files.
 
-            return csv_list
+        Args:
+            known_files (callable): Optional lookup of already stored files, see _select_remote_files.
+
+        Yields:
+            tuple: (filename, bytes, modification time in ns or None) for every confirmed transfer.
+        """
+        try:
+            remote_files = self._select_remote_files(known_files)
+            for fetched in self._map_sessions(self._fetch_file, remote_files):
+                if fetched:
+                    yield fetched
         except Exception as e:
             logging.error(f"Error downloading files: {e}")
+        finally:
+            # the next listing may show other files of the same names
+            self._partial_buffers.clear()
+
+    def delete_remote_files(self, filenames):
+        """
+        Remove files from the FTP server.
+
+        Args:
+            filenames (list): The remote file names.
+
+        Returns:
+            list: The file names that were deleted.
+        """
+        try:
+            return [
+                filename
+                for filename in self._map_sessions(self._delete_file, filenames)
+                if filename
+            ]
+        except Exception as e:
+            logging.error(f"Error deleting remote files: {e}")
             return []
 
     def ftp_has_files(self):
-        return len(self.ftp.nlst(self.remote_directory)) > 2  # Ignore . and ..
+        return any(entry.name.lower().endswith(".csv") for entry in self.list_remote_entries())
 
 
 if __name__ == "__main__":
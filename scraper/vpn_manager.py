@@ -6,6 +6,9 @@ Created on Tue Sep 26 17:01:57 2023
 @author: jules
 """
 
+import os
+import json
+import socket
 import platform
 import subprocess
 import logging
@@ -26,12 +29,17 @@ class VPNManager:
         "Darwin": ["sudo", "networksetup", "-disconnectpppoeservice", "{vpn_name}"]
     }
 
-    def __init__(self, config):
+    MIN_READY_SECONDS = 4 # lower bound of the adaptive readiness timeout, the old fixed wait
+    READY_MARGIN = 3 # the adaptive timeout is this many times the usual time to get ready
+    MAX_POLL_SECONDS = 1 # slowest readiness poll
+
+    def __init__(self, config, basedir=None):
         """
         Initialize the VPNManager with configuration settings.
 
         Args:
             config (dict): A dictionary containing VPN configuration settings.
+            basedir (str): Optional directory for the readiness history file.
 
         Returns:
             None
@@ -42,7 +50,13 @@ class VPNManager:
         self.vpn_password = self.config.get("vpn", "vpn_password")
         self.vpn_server_ip = self.config.get("vpn", "vpn_server_ip")
         self.timeout_seconds = 20 # connection time out
-        self.wait_seconds = 4 # wait for the vpn to finish setting up the connection
+        self.ready_timeout = float(self.config.get("vpn", "ready_timeout", 20)) # longest wait for the tunnel
+        self.poll_seconds = float(self.config.get("vpn", "poll_seconds", 0.2)) # first readiness poll
+        self.probe_host = self.config.get("ftp", "ftp_server", None) # must be reachable through the tunnel
+        self.probe_port = int(self.config.get("ftp", "ftp_port", 21))
+        ready_history = self.config.get("vpn", "ready_history", "")
+        self.history_path = os.path.join(basedir, ready_history) if basedir and ready_history else None
+        self.ready_estimate = self._load_ready_estimate()
 
         # Construct connect and disconnect commands based on the platform.
         self.connect_command = self._construct_command(self.CONNECT_COMMANDS)
@@ -220,6 +234,124 @@ class VPNManager:
 
         return returncode == 0
 
+    def _load_ready_estimate(self):
+        """
+        Read the usual time the tunnel needs to get ready from the history file.
+
+        Returns:
+            float: Seconds, None without history.
+        """
+        if not self.history_path:
+            return None
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as history_file:
+                return float(json.load(history_file)["ready_estimate"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring VPN readiness history {self.history_path}: {e}")
+            return None
+
+    def _record_ready_time(self, seconds):
+        """
+        Fold the time the tunnel needed (or the timeout it hit) into the estimate
+        as an exponentially weighted moving average, and store it.
+
+        Args:
+            seconds (float): The time to get ready.
+
+        Returns:
+            None
+        """
+        if self.ready_estimate is None:
+            self.ready_estimate = seconds
+        else:
+            self.ready_estimate = 0.7 * self.ready_estimate + 0.3 * seconds
+
+        if not self.history_path:
+            return
+        try:
+            with open(self.history_path, "w", encoding="utf-8") as history_file:
+                json.dump({"ready_estimate": self.ready_estimate}, history_file)
+        except OSError as e:
+            # the history only shortens the next wait; a failure is not fatal
+            logging.warning(f"Cannot write VPN readiness history {self.history_path}: {e}")
+
+    def ready_timeout_seconds(self):
+        """
+        Adaptive readiness timeout: READY_MARGIN times the usual time to get ready,
+        between MIN_READY_SECONDS and ready_timeout. Without history it is ready_timeout.
+
+        Returns:
+            float: Seconds.
+        """
+        if self.ready_estimate is None:
+            return self.ready_timeout
+        return min(self.ready_timeout, max(self.MIN_READY_SECONDS, self.READY_MARGIN * self.ready_estimate))
+
+    def probe_reachable(self, timeout=None):
+        """
+        Check that the FTP host accepts a TCP connection, i.e. the tunnel routes traffic.
+
+        Args:
+            timeout (float): Connection timeout in seconds.
+
+        Returns:
+            bool: True if the host is reachable or no host is configured, False otherwise.
+        """
+        if not self.probe_host:
+            return True
+        try:
+            socket.create_connection((self.probe_host, self.probe_port), timeout=timeout or self.MAX_POLL_SECONDS).close()
+            return True
+        except OSError:
+            return False
+
+    def _tunnel_ready(self, timeout):
+        if platform.system() == "Linux" and not self.linux_vpn_connected():
+            return False
+        return self.probe_reachable(timeout)
+
+    def wait_until_ready(self):
+        """
+        Poll until ppp0 is up (Linux) and the FTP host is reachable through the tunnel.
+
+        Polls start at poll_seconds and back off to MAX_POLL_SECONDS. A tunnel
+        that is slower than ready_timeout_seconds only logs a warning; the wait
+        fails after ready_timeout.
+
+        Returns:
+            bool: True if the tunnel is ready, False on timeout.
+        """
+        expected = self.ready_timeout_seconds()
+        timeout = max(expected, self.ready_timeout)
+        start = time.monotonic()
+        delay = self.poll_seconds
+        warned = False
+
+        while True:
+            remaining = timeout - (time.monotonic() - start)
+            if self._tunnel_ready(max(0.1, min(self.MAX_POLL_SECONDS, remaining))):
+                elapsed = time.monotonic() - start
+                logging.info(f"VPN ready after {elapsed:.1f}s")
+                self._record_ready_time(elapsed)
+                return True
+
+            elapsed = time.monotonic() - start
+            if not warned and elapsed >= expected:
+                logging.warning(f"VPN not ready after {expected:.1f}s, slower than usual; waiting up to {timeout:.1f}s")
+                warned = True
+
+            remaining = timeout - elapsed
+            if remaining <= 0:
+                logging.error(f"VPN not ready after {timeout:.1f}s")
+                # a timeout counts as a slow start, so repeated failures widen the wait
+                self._record_ready_time(timeout)
+                return False
+
+            time.sleep(min(delay, remaining))
+            delay = min(2 * delay, self.MAX_POLL_SECONDS)
+
     def connect(self):
         """
         Connect to the VPN using the configured connection command.
@@ -240,8 +372,10 @@ class VPNManager:
             
         returncode = self._execute_command(self.connect_command)
         logging.info(f'returncode {returncode}')
-        time.sleep(self.wait_seconds) # give vpn connection some time to get itself and it's route up
-        return returncode == 0
+        if returncode != 0:
+            return False
+        # wait for the vpn connection and its route to come up
+        return self.wait_until_ready()
 
     def disconnect(self):
         """
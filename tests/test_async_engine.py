@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A run of the AsyncEngine with a backlog in the download folder, against a
+local FTP server (pyftpdlib): every file of the backlog and of the new batch
+must end up in the backup folder.
+
+usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import asyncio
+import sqlite3
+import logging
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+
+# local modules
+from core.migration_manager import MigrationManager
+from scraper.async_engine import AsyncEngine
+from scraper.archive_backend import iter_members
+
+try:
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+except ImportError:
+    ThreadedFTPServer = None
+
+INIT_DB = "_init/database.db"
+BACKLOG = 5
+REMOTE = 30
+NOW = datetime(2023, 10, 5, 12, 0, 0) # every archive of the run in the same second
+
+
+class Config:
+    """ Minimal stand-in for ConfigurationManager. """
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, section, key, fallback=None):
+        return self.values.get((section, key), fallback)
+
+    def getint(self, section, key, fallback=None):
+        return int(self.get(section, key, fallback))
+
+    def getboolean(self, section, key, fallback=None):
+        value = self.get(section, key, fallback)
+        return value if isinstance(value, bool) else value == "yes"
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def write_meter_files(directory, first, count):
+    """ [count] meter files of different meters, shaped like the Socomec export. """
+    for meter in range(first, first + count):
+        name = f"A{meter // 4:04d}_E{meter % 4:02d}@22"
+        lines = [
+            "Name,Serial,Type,Unit,Date,Status",
+            f"{name},{100000 + meter},Countis E03,kWh,2023-10-05T00:00:00,OK",
+            "",
+        ]
+        lines += [f"Info{row},-,-,-,-,-" for row in range(2, 8)]
+        lines += [f"2023-10-05T00:00:00,{336684 + meter},0,0,0,0"]
+        with open(os.path.join(directory, f"{name}_000.csv"), "w", encoding="utf-8") as meter_file:
+            meter_file.write("\n".join(lines) + "\n")
+
+
+@unittest.skipIf(ThreadedFTPServer is None, "needs pyftpdlib")
+class BacklogRunTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.workdir = tempfile.mkdtemp()
+        self.remote_dir = os.path.join(self.workdir, "remote")
+        self.data_dir = os.path.join(self.workdir, "data")
+        self.backup_dir = os.path.join(self.workdir, "backup")
+        for directory in (self.remote_dir, self.data_dir, self.backup_dir):
+            os.makedirs(directory)
+
+        db_path = os.path.join(self.workdir, "socomec.db")
+        shutil.copy(INIT_DB, db_path)
+        MigrationManager(db_path).migrate()
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_user("test", "test", self.remote_dir, perm="elrd")
+        handler = type("Handler", (FTPHandler,), {"authorizer": authorizer})
+        self.server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.close_all()
+        shutil.rmtree(self.workdir)
+        logging.disable(logging.NOTSET)
+
+    def config(self, transfer_mode):
+        return Config({
+            ("folders", "csv_result"): "result.csv",
+            ("folders", "db_name"): "socomec.db",
+            ("ftp", "ftp_server"): "127.0.0.1",
+            ("ftp", "ftp_port"): str(self.server.socket.getsockname()[1]),
+            ("ftp", "ftp_user"): "test",
+            ("ftp", "ftp_password"): "test",
+            ("ftp", "remote_directory"): "/",
+            ("ftp", "ftp_connections"): "2",
+            ("ftp", "transfer_mode"): transfer_mode,
+            ("ftp", "settle_seconds"): "0", # the files are brand new
+            ("archive", "codec"): "zip",
+            ("performance", "parse_workers"): "1",
+            ("performance", "parse_executor"): "thread",
+        })
+
+    def run_with_backlog(self, transfer_mode):
+        write_meter_files(self.data_dir, 0, BACKLOG)
+        write_meter_files(self.remote_dir, BACKLOG, REMOTE)
+
+        engine = AsyncEngine(self.config(transfer_mode), self.workdir, self.data_dir, self.backup_dir)
+        with mock.patch("scraper.async_engine.VPNManager") as vpn_manager, \
+                mock.patch.object(AsyncEngine, "_send_email"), \
+                mock.patch("scraper.data_manager.datetime", FixedDatetime):
+            vpn_manager.return_value.connect.return_value = True
+            asyncio.run(engine.run())
+
+        archives = sorted(os.listdir(self.backup_dir))
+        members = [member for archive in archives for member, _ in iter_members(os.path.join(self.backup_dir, archive))]
+        self.assertEqual(len(archives), 2, archives)
+        self.assertEqual(len(members), BACKLOG + REMOTE)
+        self.assertEqual(len(set(members)), BACKLOG + REMOTE)
+        self.assertEqual(os.listdir(self.remote_dir), [])
+        self.assertEqual(os.listdir(self.data_dir), [])
+
+        conn = sqlite3.connect(os.path.join(self.workdir, "socomec.db"))
+        try:
+            (readings,), = conn.execute("SELECT COUNT(*) FROM Readings").fetchall()
+        finally:
+            conn.close()
+        self.assertEqual(readings, BACKLOG + REMOTE)
+
+    def test_disk_mode(self):
+        self.run_with_backlog("disk")
+
+    def test_memory_mode(self):
+        self.run_with_backlog("memory")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The schema migrations on a database of the first version (duplicate addresses,
+meters and readings), and DailyConsumption after readings that arrive out of
+order, compared with a full recompute.
+
+usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sqlite3
+import logging
+import tempfile
+import unittest
+
+# local modules
+from core.migration_manager import CONSUMPTION_DIRTY, MigrationManager, refresh_daily_consumption
+from scraper.csv_reader import make_reading
+from scraper.data_manager import DataManager
+from tests.test_async_engine import INIT_DB, Config
+
+# the first schema, before the unique constraints
+V0_SCHEMA = """
+CREATE TABLE Addresses (AddressID INTEGER PRIMARY KEY AUTOINCREMENT, AddressText VARCHAR(255) NOT NULL);
+CREATE TABLE Meters (MeterID INTEGER PRIMARY KEY AUTOINCREMENT, MeterName VARCHAR(255), AddressID INT);
+CREATE TABLE Readings (ReadingID INTEGER PRIMARY KEY AUTOINCREMENT, MeterID INT, ReadingValue INT NOT NULL, ReadingDate DATE NOT NULL);
+"""
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, "socomec.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+        logging.disable(logging.NOTSET)
+
+    def test_v0_duplicates(self):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.executescript(V0_SCHEMA)
+            conn.executemany("INSERT INTO Addresses VALUES (?, ?)", [(1, "A0000"), (2, "A0001"), (3, "A0000")])
+            conn.executemany(
+                "INSERT INTO Meters VALUES (?, ?, ?)",
+                [(1, "A0000_E00@22", 1), (2, "A0001_E00@22", 2), (3, "A0000_E00@22", 3), (4, "A0000_E01@22", 3)],
+            )
+            conn.executemany("INSERT INTO Readings VALUES (?, ?, ?, ?)", [
+                (1, 1, 100, "2023-10-01T00:00:00"),
+                (2, 3, 101, "2023-10-01T00:00:00"), # same meter and date as reading 1
+                (3, 3, 120, "2023-10-02T00:00:00"), # only on the duplicate meter
+                (4, 2, 50, "2023-10-01T00:00:00"),
+                (5, 2, 51, "2023-10-01T00:00:00"), # duplicate reading
+                (6, 4, 7, "2023-10-01T00:00:00"),
+            ])
+        conn.close()
+
+        self.assertEqual(MigrationManager(self.db_path).migrate(), len(MigrationManager.MIGRATIONS))
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(
+                conn.execute("SELECT AddressID, AddressText FROM Addresses ORDER BY AddressID").fetchall(),
+                [(1, "A0000"), (2, "A0001")],
+            )
+            self.assertEqual(
+                conn.execute("SELECT MeterID, MeterName, AddressID FROM Meters ORDER BY MeterID").fetchall(),
+                [(1, "A0000_E00@22", 1), (2, "A0001_E00@22", 2), (4, "A0000_E01@22", 1)],
+            )
+            self.assertEqual(
+                conn.execute("SELECT ReadingID, MeterID, ReadingValue FROM Readings ORDER BY ReadingID").fetchall(),
+                [(1, 1, 100), (3, 1, 120), (4, 2, 50), (6, 4, 7)],
+            )
+            self.assertEqual(
+                conn.execute("SELECT MeterID, Day, LastValue, Delta, Cumulative FROM DailyConsumption WHERE MeterID = 1").fetchall(),
+                [(1, "2023-10-01", 100, 0, 0), (1, "2023-10-02", 120, 20, 20)],
+            )
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("INSERT INTO Meters (MeterName, AddressID) VALUES ('A0000_E00@22', 1)")
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("INSERT INTO Readings (MeterID, ReadingValue, ReadingDate) VALUES (1, 1, '2023-10-01T00:00:00')")
+        finally:
+            conn.close()
+
+
+class DailyConsumptionTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, "socomec.db")
+        shutil.copy(INIT_DB, self.db_path)
+        MigrationManager(self.db_path).migrate()
+        self.data_manager = DataManager(Config({("folders", "db_name"): "socomec.db"}))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+        logging.disable(logging.NOTSET)
+
+    def save(self, *readings):
+        self.data_manager.process_and_save_to_db([make_reading(*reading) for reading in readings], self.workdir)
+
+    def consumption(self, conn):
+        return conn.execute(
+            "SELECT m.MeterName, c.Day, c.LastValue, c.Delta, c.Cumulative "
+            "FROM DailyConsumption c JOIN Meters m ON m.MeterID = c.MeterID ORDER BY m.MeterName, c.Day"
+        ).fetchall()
+
+    def test_out_of_order_day(self):
+        meter, other = "A0000_E00@22", "A0000_E01@22"
+        self.save((meter, "2023-10-01T00:00:00", 100), (other, "2023-10-01T00:00:00", 10))
+        self.save((meter, "2023-10-02T00:00:00", 110), (other, "2023-10-02T00:00:00", 12))
+        self.save((meter, "2023-10-04T00:00:00", 150))
+        # the third day comes in late, and a later reading of the second day
+        self.save((meter, "2023-10-03T00:00:00", 130))
+        self.save((meter, "2023-10-02T12:00:00", 115))
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            incremental = self.consumption(conn)
+            self.assertEqual(incremental, [
+                (meter, "2023-10-01", 100, 0, 0),
+                (meter, "2023-10-02", 115, 15, 15),
+                (meter, "2023-10-03", 130, 15, 30),
+                (meter, "2023-10-04", 150, 20, 50),
+                (other, "2023-10-01", 10, 0, 0),
+                (other, "2023-10-02", 12, 2, 2),
+            ])
+
+            with conn:
+                conn.execute(CONSUMPTION_DIRTY)
+                conn.execute("INSERT INTO temp.ConsumptionDirty (MeterID, FromDay) SELECT MeterID, '' FROM Meters")
+                refresh_daily_consumption(conn.cursor())
+            self.assertEqual(self.consumption(conn), incremental)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
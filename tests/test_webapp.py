@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The reading pages of the webapp (keyset cursor) and its response cache
+(DataVersion, ETag), on a scraper database in a temporary folder.
+
+usage: python -m unittest discover tests
+"""
+
+import os
+import base64
+import shutil
+import sqlite3
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+# local modules
+from core.migration_manager import MigrationManager
+from scraper.csv_reader import make_reading
+from scraper.data_manager import DataManager
+from tests.test_async_engine import INIT_DB, Config
+
+try:
+    from fastapi.testclient import TestClient
+    from webapp import main
+    from webapp.database import ReadPool
+except ImportError: # TestClient needs httpx
+    TestClient = None
+
+METERS = ["A0000_E00@22", "A0000_E01@22", "A0001_E00@22"]
+DAYS = 5
+
+
+@unittest.skipIf(TestClient is None, "needs the webapp requirements and httpx")
+class WebappTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, "socomec.db")
+        shutil.copy(INIT_DB, self.db_path)
+        MigrationManager(self.db_path).migrate()
+        self.data_manager = DataManager(Config({("folders", "db_name"): "socomec.db"}))
+        self.save([
+            (meter, f"2023-10-{day + 1:02d}T00:00:00", 1000 * number + day)
+            for number, meter in enumerate(METERS)
+            for day in range(DAYS)
+        ])
+
+        main.cache.clear()
+        patch = mock.patch.object(main, "read_pool", ReadPool(self.db_path, 2))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.client = TestClient(main.app).__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+        logging.disable(logging.NOTSET)
+
+    def save(self, readings):
+        self.data_manager.process_and_save_to_db([make_reading(*reading) for reading in readings], self.workdir)
+
+    def pages(self, path, limit):
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(path, params={"limit": limit, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200, response.text)
+            page = response.json()
+            pages.append([(reading["meter_name"], reading["reading_date"]) for reading in page["readings"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    def test_page_boundaries(self):
+        everything = [(meter, f"2023-10-{day + 1:02d}T00:00:00") for meter in METERS for day in range(DAYS)]
+        # pages that end in the middle of a meter, and pages that end exactly on the last reading
+        for limit, sizes in ((4, [4, 4, 4, 3]), (5, [5, 5, 5]), (15, [15]), (100, [15])):
+            with self.subTest(limit=limit):
+                pages = self.pages("/readings", limit)
+                self.assertEqual([len(page) for page in pages], sizes)
+                self.assertEqual([reading for page in pages for reading in page], everything)
+
+        pages = self.pages(f"/meters/{METERS[1]}/readings", 2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual({meter for page in pages for meter, _ in page}, {METERS[1]})
+
+    def test_bad_cursor(self):
+        for cursor in (
+            "not a cursor",
+            base64.urlsafe_b64encode(b'{"MeterID": 1}').decode(),
+            base64.urlsafe_b64encode(b'["1", "2023-10-01T00:00:00"]').decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get("/readings", params={"cursor": cursor})
+                self.assertEqual(response.status_code, 400)
+
+    def test_cache_invalidation(self):
+        latest = lambda: {reading["meter_name"]: reading["reading_value"] for reading in self.client.get("/latest").json()}
+        self.assertEqual(latest()[METERS[0]], DAYS - 1)
+
+        # without a new data version the cached response is served
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute("UPDATE Readings SET ReadingValue = -1")
+        conn.close()
+        self.assertEqual(latest()[METERS[0]], DAYS - 1)
+
+        # an ingest bumps DataVersion
+        self.save([(METERS[0], "2023-10-31T00:00:00", 99)])
+        self.assertEqual(latest(), {METERS[0]: 99, METERS[1]: -1, METERS[2]: -1})
+
+    def test_etag(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+
+        response = self.client.get("/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # another request, or the same one after an ingest, has another ETag
+        self.assertNotEqual(self.client.get("/latest").headers["ETag"], etag)
+        self.save([(METERS[0], "2023-10-31T00:00:00", 99)])
+        response = self.client.get("/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+from pydantic_core import to_json
+
+
+class ResponseCache:
+    """
+    LRU cache of JSON response bodies, valid for one data version.
+
+    The scraper bumps DataVersion in every ingest transaction; the first
+    request that sees a new version empties the cache. Entries also expire
+    after ttl_seconds, for changes made outside the scraper.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = None
+        self.entries = OrderedDict() # key -> (expires, body)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock() # also safe for sync endpoints in the thread pool
+
+    def get(self, key, version):
+        """
+        Look up a body.
+
+        Args:
+            key (str): The request, see request_key.
+            version (int): The current data version.
+
+        Returns:
+            bytes: The cached body, None on a miss.
+        """
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self.lock:
+            if version != self.version:
+                return # computed from an older version
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+
+
+async def data_version(db):
+    """ The data version of the database: one primary key lookup. """
+    (version,), = await db.execute_fetchall("SELECT Version FROM DataVersion WHERE ID = 1")
+    return version
+
+
+def request_key(request):
+    """ Path and query parameters, independent of the parameter order. """
+    return request.url.path + "?" + "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+
+
+async def cached_response(request, db, cache, compute):
+    """
+    Answer a GET request from the cache, or compute and cache the answer.
+
+    The ETag is the data version plus the request, so a client that sends it
+    back in If-None-Match gets 304 Not Modified until the next ingest,
+    without the query running at all.
+
+    Args:
+        request (Request): The request.
+        db (aiosqlite.Connection): Read-only connection, see webapp.database.ReadPool.
+        cache (ResponseCache): The cache.
+        compute (callable): Coroutine function that builds the response data (a model, list or dict) on a miss.
+
+    Returns:
+        Response: The JSON response, or 304.
+    """
+    version = await data_version(db)
+    key = request_key(request)
+    etag = f'"{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} # revalidate with If-None-Match
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    body = cache.get(key, version)
+    if body is None:
+        # pydantic's serializer: jsonable_encoder walks every field in Python
+        body = to_json(await compute())
+        cache.put(key, version, body)
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,45 +1,100 @@
-from typing import Optional
-from datetime import datetime
-from sqlmodel import Field, Session, SQLModel, create_engine
+import os
+import asyncio
+import sqlite3
+import contextlib
+from pathlib import Path
 
-# Create a SQLAlchemy engine and connect to your database
-DB_FILE = "test.db"
-engine = create_engine(f"sqlite:///{DB_FILE}", echo=True)
+import aiosqlite
+from sqlmodel import Session, create_engine
 
+# local modules
+from core.configuration_manager import ConfigurationManager
+from core.database import TIMEOUT_SECONDS, apply_pragmas, database_pragmas
+from core.utils import canonical_path
 
-# Define SQLModel classes for Addresses, Meters, and Readings tables
-class Address(SQLModel, table=True):
-    address_id: Optional[int] = Field(default=None, primary_key=True)
-    address_text: str
+config = ConfigurationManager()
 
 
-class Meter(SQLModel, table=True):
-    meter_id: Optional[int] = Field(default=None, primary_key=True)
-    meter_name: str | None = None
-    address_id: int
+def scraper_db_file():
+    """ The database of scraper.py: [folders] db_name in MOUNT_POINT, or in ../mnt/ locally. """
+    local_base_dir = canonical_path(os.path.join(Path(os.getcwd()).resolve().parents[0], "mnt/"))
+    base_dir = canonical_path(os.getenv("MOUNT_POINT", local_base_dir))
+    return canonical_path(os.path.join(base_dir, config.get("folders", "db_name", "socomec.db")))
 
 
-class Reading(SQLModel, table=True):
-    reading_id: Optional[int] = Field(default=None, primary_key=True)
-    meter_id: int
-    reading_value: int
-    reading_date: datetime
+# the scraper database; the webapp never creates or migrates tables, see webapp/models.py
+DB_FILE = os.getenv("DB_FILE") or scraper_db_file() # e.g. DB_FILE=/outside/socomec.db
 
+# the same pragma profile as the scraper ([database] section), so the web UI
+# reads from the WAL while the scraper writes
+PRAGMAS = database_pragmas(config)
 
-# Create the tables in the database
-# create_table(engine, Address)
-# create_table(engine, Meter)
-# create_table(engine, Reading)
-def create_tables():
-    SQLModel.metadata.create_all()
+# the journal mode is the writer's to set, a read-only connection cannot change it
+READ_PRAGMAS = {name: value for name, value in PRAGMAS.items() if name != "journal_mode"}
 
 
-# # Optionally, create the unique index if it doesn't exist (SQLite specific)
-# with Session(engine) as session:
-#     session.execute(
-#         "CREATE UNIQUE INDEX IF NOT EXISTS MeterReadingDate on Readings (MeterID, ReadingDate)"
-#     )
+class _ReadConnection(sqlite3.Connection):
+    """ sqlite3 connection with the read pragmas, set up in the thread of aiosqlite. """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        apply_pragmas(self, READ_PRAGMAS)
 
-if __name__ == "__main__":
-    create_tables()
+
+class ReadPool:
+    """
+    Bounded pool of read-only aiosqlite connections for the query endpoints.
+
+    aiosqlite runs every connection in a thread of its own, so a request
+    waiting for SQLite frees the event loop instead of holding a worker
+    thread. Connections are opened on demand up to [size]; further requests
+    wait for a free one. A query is one call into the connection thread
+    (execute_fetchall), which is why this is not an async SQLAlchemy engine:
+    its cursor, fetch and rollback round trips cost about three times more
+    per request.
+    """
+
+    def __init__(self, db_file, size):
+        self.db_file = db_file
+        self.size = size
+        self.opened = 0
+        self.idle = asyncio.LifoQueue() # the most recently used connection has a warm cache
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        if self.idle.empty() and self.opened < self.size:
+            self.opened += 1
+            try:
+                conn = await aiosqlite.connect(
+                    f"file:{self.db_file}?mode=ro", uri=True, timeout=TIMEOUT_SECONDS, factory=_ReadConnection
+                )
+            except Exception:
+                self.opened -= 1
+                raise
+        else:
+            conn = await self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put_nowait(conn)
+
+    async def close(self):
+        while not self.idle.empty():
+            await self.idle.get_nowait().close()
+            self.opened -= 1
+
+
+read_pool = ReadPool(DB_FILE, config.getint("webapp", "pool_size", 8))
+
+# read-only engine for the ORM endpoints, with the same connections and pool size as read_pool
+engine = create_engine(
+    f"sqlite:///file:{DB_FILE}?mode=ro&uri=true",
+    connect_args={"timeout": TIMEOUT_SECONDS, "factory": _ReadConnection},
+    pool_size=read_pool.size,
+)
+
+
+def get_session():
+    """ ORM session for the endpoints that load model objects, see webapp/models.py. """
+    with Session(engine) as session:
+        yield session
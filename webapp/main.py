@@ -1,49 +1,290 @@
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel, Field
-
-import webapp.models
-from webapp.database import engine, SessionLocal
-from sqlalchemy.orm import Session
-
-app = FastAPI()
-
-webapp.models.Base.metadata.create_all(bind=engine)
-
-
-def get_db():
-    try:
-        db = SessionLocal()
-        yield db
-    finally:
-        db.close()
-
-
-class Adress(BaseModel):
-    AddressText: str = Field(min_length=1)
-
-
-ADDRESSES = []
-
-
-@app.get("/")
-def read_api(db: Session = Depends(get_db)):
-    return db.query(webapp.models.Address).all()
-
-
-# from typing import List
-# from fastapi import FastAPI
-
-# from webapp.models import Address, Meter, Reading
-
-# app = FastAPI()
-
-
-# @app.get("/")
-# async def read_main():
-#     return {"msg": "Hello World"}
-
-
-if __name__ == "__main__":
-    import uvicorn
-
-    uvicorn.run(app, host="localhost", port=8000)
+import json
+import base64
+import sqlite3
+import binascii
+from datetime import datetime
+from typing import Optional
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlmodel import Session, select
+
+from core.configuration_manager import ConfigurationManager
+from core.database import connect
+from core.export import EXPORT_FORMATS, check_export_format, iter_export
+from webapp.cache import ResponseCache, cached_response
+from webapp.database import DB_FILE, READ_PRAGMAS, get_session, read_pool
+from webapp.models import Address, AddressWithMeters, Meter, MeterWithAddress, ReadingOut, ReadingPage
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await read_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+MAX_PAGE_SIZE = 1000
+
+# responses stay valid until the scraper ingests new readings, see webapp/cache.py
+config = ConfigurationManager()
+cache = ResponseCache(
+    config.getint("webapp", "cache_entries", 256),
+    config.getint("webapp", "cache_ttl_seconds", 300),
+)
+
+
+async def get_db():
+    # read-only, from the bounded pool of webapp.database.ReadPool
+    async with read_pool.connection() as db:
+        yield db
+
+
+class Adress(BaseModel):
+    AddressText: str = Field(min_length=1)
+
+
+def encode_cursor(meter_id, reading_date):
+    """ Opaque cursor for the position after (MeterID, ReadingDate). """
+    return base64.urlsafe_b64encode(json.dumps([meter_id, reading_date]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        meter_id, reading_date = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(meter_id, int) or not isinstance(reading_date, str):
+            raise ValueError(cursor)
+        return meter_id, reading_date
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def read_page(db, meters, params, since, until, cursor, limit):
+    """
+    One page of readings in (MeterID, ReadingDate) order, with keyset pagination.
+
+    The page continues after the cursor instead of skipping an OFFSET, so
+    every page is a range scan on the MeterReadingDateValue index, which also
+    holds the ReadingValue: the time per page does not grow with Readings.
+
+    Args:
+        db (aiosqlite.Connection): Read-only connection.
+        meters (str): SQL condition selecting the meters, on Meters m.
+        params (dict): Parameters of [meters].
+        since (datetime): Optional first reading date.
+        until (datetime): Optional end of the range, exclusive.
+        cursor (str): Optional next_cursor of the previous page.
+        limit (int): Readings per page.
+
+    Returns:
+        ReadingPage: The readings and the cursor of the next page.
+    """
+    params = dict(params, limit=limit + 1)
+    if cursor:
+        params["after_meter"], params["after_date"] = decode_cursor(cursor)
+        meters += " AND m.MeterID >= :after_meter"
+
+    # the readings are looked up per meter, so the date range bounds every index seek
+    conditions = [f"r.MeterID IN (SELECT m.MeterID FROM Meters m WHERE {meters})"]
+    if since:
+        conditions.append("r.ReadingDate >= :since")
+        params["since"] = since.isoformat()
+    if until:
+        conditions.append("r.ReadingDate < :until")
+        params["until"] = until.isoformat()
+    if cursor:
+        conditions.append("(r.MeterID, r.ReadingDate) > (:after_meter, :after_date)")
+
+    rows = await db.execute_fetchall(
+        "SELECT r.MeterID, m.MeterName, r.ReadingDate, r.ReadingValue "
+        "FROM Readings r JOIN Meters m ON m.MeterID = r.MeterID "
+        f"WHERE {' AND '.join(conditions)} "
+        "ORDER BY r.MeterID, r.ReadingDate LIMIT :limit",
+        params,
+    )
+
+    # one row more than the page tells if there is a next page
+    next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][2]) if len(rows) > limit else None
+    return ReadingPage(
+        readings=[
+            ReadingOut(meter_name=meter_name, reading_date=str(reading_date), reading_value=reading_value)
+            for _, meter_name, reading_date, reading_value in rows[:limit]
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@app.get("/")
+async def read_api(request: Request, db: aiosqlite.Connection = Depends(get_db)):
+    async def addresses():
+        rows = await db.execute_fetchall("SELECT AddressID, AddressText FROM Addresses ORDER BY AddressText")
+        return [{"AddressID": address_id, "AddressText": address_text} for address_id, address_text in rows]
+
+    return await cached_response(request, db, cache, addresses)
+
+
+# The ORM endpoints state how every relationship is loaded (the mappings raise
+# on lazy loads) and load only the columns of the response model.
+ADDRESS_COLUMNS = load_only(Address.AddressID, Address.AddressText, raiseload=True)
+METER_COLUMNS = load_only(Meter.MeterID, Meter.MeterName, raiseload=True)
+
+
+@app.get("/addresses", response_model=list[AddressWithMeters])
+def read_addresses(session: Session = Depends(get_session)):
+    """ The addresses with their meters: two queries, the meters in one IN (...) batch. """
+    return session.exec(
+        select(Address)
+        .options(ADDRESS_COLUMNS, selectinload(Address.meters).options(METER_COLUMNS))
+        .order_by(Address.AddressText)
+    ).all()
+
+
+@app.get("/meters", response_model=list[MeterWithAddress])
+def read_meters(address: Optional[str] = None, session: Session = Depends(get_session)):
+    """ The meters with their address, in one joined query. """
+    statement = select(Meter).options(METER_COLUMNS, joinedload(Meter.address).options(ADDRESS_COLUMNS))
+    if address:
+        statement = statement.where(Meter.address.has(Address.AddressText == address))
+    return session.exec(statement.order_by(Meter.MeterName)).all()
+
+
+@app.get("/meters/{meter_name}", response_model=MeterWithAddress)
+def read_meter(meter_name: str, session: Session = Depends(get_session)):
+    meter = session.exec(
+        select(Meter)
+        .options(METER_COLUMNS, joinedload(Meter.address).options(ADDRESS_COLUMNS))
+        .where(Meter.MeterName == meter_name)
+    ).first()
+    if meter is None:
+        raise HTTPException(status_code=404, detail="Meter not found")
+    return meter
+
+
+@app.get("/latest", response_model=list[ReadingOut])
+async def read_latest(request: Request, address: Optional[str] = None, db: aiosqlite.Connection = Depends(get_db)):
+    """ The latest reading of every meter, or of the meters of one address. """
+    async def latest():
+        rows = await db.execute_fetchall(
+            "SELECT m.MeterName, r.ReadingDate, r.ReadingValue "
+            "FROM Meters m "
+            "JOIN Addresses a ON a.AddressID = m.AddressID "
+            "JOIN Readings r ON r.MeterID = m.MeterID "
+            "AND r.ReadingDate = (SELECT MAX(ReadingDate) FROM Readings WHERE MeterID = m.MeterID) "
+            + ("WHERE a.AddressText = :address " if address else "")
+            + "ORDER BY m.MeterName",
+            {"address": address},
+        )
+        return [
+            ReadingOut(meter_name=meter_name, reading_date=str(reading_date), reading_value=reading_value)
+            for meter_name, reading_date, reading_value in rows
+        ]
+
+    return await cached_response(request, db, cache, latest)
+
+
+@app.get("/readings", response_model=ReadingPage)
+async def read_readings(
+    request: Request,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    return await cached_response(request, db, cache, lambda: read_page(db, "1", {}, since, until, cursor, limit))
+
+
+@app.get("/meters/{meter_name}/readings", response_model=ReadingPage)
+async def read_meter_readings(
+    request: Request,
+    meter_name: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    return await cached_response(
+        request, db, cache,
+        lambda: read_page(db, "m.MeterName = :meter_name", {"meter_name": meter_name}, since, until, cursor, limit),
+    )
+
+
+@app.get("/addresses/{address_text}/readings", response_model=ReadingPage)
+async def read_address_readings(
+    request: Request,
+    address_text: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    return await cached_response(
+        request, db, cache,
+        lambda: read_page(
+            db,
+            "m.AddressID IN (SELECT AddressID FROM Addresses WHERE AddressText = :address_text)",
+            {"address_text": address_text},
+            since, until, cursor, limit,
+        ),
+    )
+
+
+@app.get("/export")
+def export_readings(
+    format: str = Query("csv", pattern="^(" + "|".join(EXPORT_FORMATS) + ")$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    meter: Optional[str] = None,
+    address: Optional[str] = None,
+):
+    """
+    Stream the readings as a CSV, NDJSON or Parquet file, e.g. a month for billing.
+
+    The rows go from the SQLite cursor to the response batch by batch, so the
+    memory use of the webapp does not depend on the size of the export.
+    """
+    try:
+        check_export_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = {
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        "meter": meter,
+        "address": address,
+    }
+
+    # read-only like ReadPool; opened before the response starts, so a missing
+    # database is an error response instead of a cut-off file
+    try:
+        conn = connect(f"file:{DB_FILE}?mode=ro", READ_PRAGMAS, uri=True, check_same_thread=False)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=503, detail=f"Database not available: {e}")
+
+    def stream():
+        # the response is written from the thread pool, one batch per call
+        try:
+            yield from iter_export(conn, format, **filters)
+        finally:
+            conn.close()
+
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="readings{extension}"'},
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="localhost", port=8000)
@@ -1,21 +1,70 @@
 from typing import Optional
-from datetime import datetime
-from pydantic import BaseModel
 
+from sqlmodel import Field, Relationship, SQLModel
 
-class Address(BaseModel):
-    id: Optional[int] = None
-    address_text: str
 
+# The tables the scraper writes (docs/create table.sql); the schema itself is
+# created and migrated by core/migration_manager.py, never by the webapp.
+#
+# Relationships are lazy="raise": a query states how it loads them
+# (selectinload, joinedload), so a forgotten option fails loudly instead of
+# running one query per row.
+class Address(SQLModel, table=True):
+    __tablename__ = "Addresses"
 
-class Meter(BaseModel):
-    id: Optional[int] = None
+    AddressID: Optional[int] = Field(default=None, primary_key=True)
+    AddressText: str = Field(unique=True)
+
+    meters: list["Meter"] = Relationship(back_populates="address", sa_relationship_kwargs={"lazy": "raise"})
+
+
+class Meter(SQLModel, table=True):
+    __tablename__ = "Meters"
+
+    MeterID: Optional[int] = Field(default=None, primary_key=True)
+    MeterName: Optional[str] = Field(default=None, unique=True)
+    AddressID: Optional[int] = Field(default=None, foreign_key="Addresses.AddressID")
+
+    address: Optional[Address] = Relationship(back_populates="meters", sa_relationship_kwargs={"lazy": "raise"})
+    readings: list["Reading"] = Relationship(back_populates="meter", sa_relationship_kwargs={"lazy": "raise"})
+
+
+class Reading(SQLModel, table=True):
+    __tablename__ = "Readings"
+
+    ReadingID: Optional[int] = Field(default=None, primary_key=True)
+    MeterID: Optional[int] = Field(default=None, foreign_key="Meters.MeterID")
+    ReadingValue: int
+    ReadingDate: str # ISO 8601 text, as the meter files have it
+
+    meter: Optional[Meter] = Relationship(back_populates="readings", sa_relationship_kwargs={"lazy": "raise"})
+
+
+# Response models: only the columns the endpoints load (load_only)
+class MeterOut(SQLModel):
+    MeterID: int
+    MeterName: Optional[str] = None
+
+
+class AddressOut(SQLModel):
+    AddressID: int
+    AddressText: str
+
+
+class AddressWithMeters(AddressOut):
+    meters: list[MeterOut] = []
+
+
+class MeterWithAddress(MeterOut):
+    address: Optional[AddressOut] = None
+
+
+class ReadingOut(SQLModel):
     meter_name: str
-    address_id: int
+    reading_date: str
+    reading_value: int
 
 
-class Reading(BaseModel):
-    id: Optional[int] = None
-    meter_id: int
-    reading_date: datetime
-    reading_value: float
+class ReadingPage(SQLModel):
+    readings: list[ReadingOut]
+    next_cursor: Optional[str] = None # pass as ?cursor= for the next page; None on the last page